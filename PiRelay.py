@@ -8,35 +8,140 @@
 
 
 import logging
-import RPi.GPIO as GPIO
+import time
 
-GPIO.setmode(GPIO.BOARD)
-GPIO.setwarnings(False)
+from common import metrics
 
-FORMAT = '%(asctime)-15s %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=FORMAT)
 logger = logging.getLogger(__name__)
 
+RELAY_WRITE = metrics.histogram('relay_write_seconds', 'Time of one batched GPIO write of the relays')
+
+# The GPIO backend, RPi.GPIO unless use_gpio() selected another one.
+GPIO = None
+
+
+class FakeGPIO:
+    ''' In-memory stand-in for RPi.GPIO, for running the relay code off the Pi
+
+    Every pin written is recorded in ``calls`` as (time.perf_counter(), pin, value),
+    the last value of each pin is kept in ``state`` and ``outputs`` counts the output() calls.
+    output() takes a pin or a list of pins, like RPi.GPIO.
+    '''
+    BOARD = 10
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self):
+        self.state = {}
+        self.calls = []
+        self.outputs = 0
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode):
+        self.state.setdefault(pin, self.LOW)
+
+    def output(self, pin, value):
+        self.outputs += 1
+        now = time.perf_counter()
+        pins = pin if isinstance(pin, (list, tuple)) else [pin]
+        values = value if isinstance(value, (list, tuple)) else [value] * len(pins)
+        for p, v in zip(pins, values):
+            self.state[p] = v
+            self.calls.append((now, p, v))
+
+
+def use_gpio(backend=None):
+    ''' Select the GPIO backend used by Relay
+
+    Arguments:
+    backend = module or object with the RPi.GPIO interface (i.e. FakeGPIO()), RPi.GPIO if None
+    '''
+    global GPIO
+    if backend is None:
+        import RPi.GPIO as backend
+    backend.setmode(backend.BOARD)
+    backend.setwarnings(False)
+    GPIO = backend
+    return backend
+
+
 class Relay:
     ''' Class to handle Relay
 
     Arguments:
     relay = string Relay label (i.e. "RELAY1","RELAY2","RELAY3","RELAY4")
+    pin = board pin driving the relay, relaypins[relay] if None (i.e. for another PiRelay board)
     '''
     relaypins = {"RELAY1":35, "RELAY2":33, "RELAY3":31, "RELAY4":29}
 
 
-    def __init__(self, relay):
-        self.pin = self.relaypins[relay]
+    def __init__(self, relay, pin=None):
+        if GPIO is None:
+            use_gpio()
+        self.pin = self.relaypins[relay] if pin is None else pin
         self.relay = relay
         GPIO.setup(self.pin,GPIO.OUT)
         GPIO.output(self.pin, GPIO.LOW)
+        self.state = False
 
     def on(self):
-        logger.debug(self.relay + " - ON")
-        GPIO.output(self.pin,GPIO.HIGH)
+        if not self.state:
+            logger.debug("%s - ON", self.relay)
+            GPIO.output(self.pin,GPIO.HIGH)
+            self.state = True
 
     def off(self):
-        logger.debug(self.relay + " - OFF")
-        GPIO.output(self.pin,GPIO.LOW)
+        if self.state:
+            logger.debug("%s - OFF", self.relay)
+            GPIO.output(self.pin,GPIO.LOW)
+            self.state = False
+
+
+class RelayBank:
+    ''' Class to handle the relays of one board together
+
+    Keeps the last written state of every relay and only writes the pins that change.
+    The pins changed by one call are written with a single GPIO.output() call.
+
+    Arguments:
+    pins = dict of relay label -> board pin, Relay.relaypins for the labels not given
+    '''
+
+    def __init__(self, pins=None):
+        if GPIO is None:
+            use_gpio()
+        self.pins = dict(Relay.relaypins, **(pins or {}))
+        self.state = dict.fromkeys(self.pins, False)
+        for pin in self.pins.values():
+            GPIO.setup(pin, GPIO.OUT)
+        GPIO.output(list(self.pins.values()), GPIO.LOW)
+
+    def set(self, on=(), off=()):
+        ''' Switch the relays labelled in on on and the ones in off off, in that order '''
+        changes = [(relay, True) for relay in on if not self.state[relay]]
+        changes += [(relay, False) for relay in off if self.state[relay]]
+        if not changes:
+            return
+        logger.debug("%s", changes)
+        s = time.perf_counter()
+        GPIO.output([self.pins[relay] for relay, _ in changes],
+                    [GPIO.HIGH if value else GPIO.LOW for _, value in changes])
+        RELAY_WRITE.observe(time.perf_counter() - s)
+        for relay, value in changes:
+            self.state[relay] = value
+
+    def on(self, *relays):
+        self.set(on=relays)
+
+    def off(self, *relays):
+        self.set(off=relays)
+
+    def all_off(self):
+        self.set(off=self.pins)
 
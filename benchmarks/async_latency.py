@@ -0,0 +1,155 @@
+"""Latency from the audio callback to the command handler, threaded pipeline against the asyncio pipeline.
+
+Replays a wav file in real time through a ``RecognitionSession``, as ``main.main_loop`` runs a chair
+("threads": ``task_action`` in a thread, ``cmd_handler``) and as ``main.async_main_loop`` does ("asyncio":
+``AsyncRecognitionSession``, an ``asyncio.Queue`` and ``async_cmd_handler``). The recognizer is scripted: every
+``--every`` blocks it returns a final result, after ``--decode-ms`` spent outside the GIL as in vosk. So only
+the pipeline is measured: the time from the callback of the block that completes an utterance to
+``execute`` of its command, and the CPU time of the process.
+
+Run from the repository root, no vosk model needed:
+
+    python -m benchmarks.async_latency --replay recordings/session.wav [--every 40] [--decode-ms 2]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import PiRelay
+from benchmarks.stats import print_summary
+from common.audio import WavSource
+from common.reload import TableWatcher
+from config import load_config
+
+RATE = 16000
+
+
+class ScriptedRecognizer:
+    """Stands in for KaldiRecognizer: a final result every ``every`` calls, each call taking ``decode`` secs."""
+
+    def __init__(self, every, decode):
+        self.every = every
+        self.decode = decode
+        self.calls = 0
+        # Index of the block that completed each utterance.
+        self.finals = []
+
+    def AcceptWaveform(self, data):
+        time.sleep(self.decode)
+        self.calls += 1
+        if self.calls % self.every:
+            return False
+        self.finals.append(self.calls - 1)
+        return True
+
+    def Result(self):
+        return json.dumps({'text': 'stop'})
+
+    FinalResult = Result
+
+    def PartialResult(self):
+        return json.dumps({'partial': ''})
+
+    def Reset(self):
+        pass
+
+
+def scripted_session(args, configs, source):
+    from main import VOSK_CHUNK
+    from vosk_microphone_pi import RecognitionSession
+
+    class ScriptedSession(RecognitionSession):
+        def open(self, callback=None):
+            self.source.start(callback=callback or self._callback)
+            self.rec = ScriptedRecognizer(args.every, args.decode_ms / 1e3)
+
+    table = configs['cmd_table']
+    cmd_table, d = TableWatcher(table['package'], table['table_name'], table['build_dict']).reload()
+    return ScriptedSession(model=None, sample_rate=RATE, cmd_table=cmd_table, d=d, chunk=VOSK_CHUNK, source=source)
+
+
+class TimedSource(WavSource):
+    """WavSource recording when every block is passed to the callback."""
+
+    def start(self, callback=None):
+        self.delivered = []
+
+        def timed(block, frames, time_info, status):
+            self.delivered.append(time.perf_counter())
+            callback(block, frames, time_info, status)
+
+        super().start(timed)
+
+
+def timed_execute(handler):
+    executed = []
+    execute = handler.execute
+
+    def timed(cmd):
+        executed.append(time.perf_counter())
+        execute(cmd)
+
+    handler.execute = timed
+    return executed
+
+
+def run_threads(args, configs, source):
+    from main import cmd_handler, task_action
+
+    session = scripted_session(args, configs, source)
+    handler = cmd_handler()
+    executed = timed_execute(handler)
+    session.open()
+    thread = threading.Thread(target=task_action, args=(handler, session))
+    thread.start()
+    thread.join()
+    session.close()
+    handler.shutdown()
+    return session.rec.finals, executed
+
+
+async def run_asyncio(args, configs, source):
+    from main import actuate, async_cmd_handler, async_task_action
+    from vosk_microphone_pi import AsyncRecognitionSession
+
+    session = AsyncRecognitionSession(scripted_session(args, configs, source))
+    handler = async_cmd_handler()
+    executed = timed_execute(handler)
+    commands = asyncio.Queue()
+    async with session:
+        actuator = asyncio.create_task(actuate(handler, commands))
+        await async_task_action(session, commands)
+        # Let the actuator take the last command.
+        await asyncio.sleep(0.1)
+        actuator.cancel()
+    handler.shutdown()
+    return session.session.rec.finals, executed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--every', type=int, default=40, help='blocks per utterance')
+    parser.add_argument('--decode-ms', type=float, default=2.0, help='time of every recognizer call')
+    parser.add_argument('--pipelines', nargs='+', choices=['threads', 'asyncio'], default=['threads', 'asyncio'])
+    args = parser.parse_args()
+
+    PiRelay.use_gpio(PiRelay.FakeGPIO())
+    configs = load_config()
+    for pipeline in args.pipelines:
+        source = TimedSource(args.replay, RATE, 200, realtime=True)
+        cpu = time.process_time()
+        if pipeline == 'threads':
+            finals, executed = run_threads(args, configs, source)
+        else:
+            finals, executed = asyncio.run(run_asyncio(args, configs, source))
+        cpu = time.process_time() - cpu
+        latency = [t - source.delivered[i] for i, t in zip(finals, executed)]
+        print_summary(f'[{pipeline}] callback to execute', latency)
+        print(f'[{pipeline}] {len(executed)}/{len(finals)} commands, CPU {cpu / source.duration * 100:.1f}%')
+
+
+if __name__ == '__main__':
+    main()
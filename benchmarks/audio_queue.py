@@ -0,0 +1,86 @@
+"""Audio-to-decision lag when the recognizer is slower than real time.
+
+A producer thread puts 12.5 ms blocks at real-time pace, as the PortAudio callback does; the consumer takes
+``--slowdown`` times as long as real time for each block, half of it a fixed cost per call, as a recognizer
+under CPU contention would. The unbounded ``queue.Queue`` of the old callback is compared with ``AudioQueue``
+and both of its policies.
+
+Run from the repository root:
+
+    python -m benchmarks.audio_queue [--seconds 10] [--slowdown 1.5]
+"""
+import argparse
+import queue
+import threading
+import time
+
+from common.audio import AudioQueue
+
+RATE = 16000
+BLOCK = 200  # samples, blocksize of the vosk stream
+BLOCK_TIME = BLOCK / RATE
+
+
+class UnboundedQueue:
+    """The old module-global queue.Queue, with the same interface as AudioQueue."""
+
+    def __init__(self):
+        self._q = queue.Queue()
+        self.high_water = 0
+        self.max_lag = 0.0
+
+    def put(self, data, status=None):
+        self._q.put((bytes(data), time.monotonic()))
+        self.high_water = max(self.high_water, self._q.qsize())
+
+    def get(self, timeout=None):
+        return self._q.get(timeout=timeout)
+
+    def done(self, captured):
+        self.max_lag = max(self.max_lag, time.monotonic() - captured)
+
+
+def run(q, seconds, slowdown):
+    block = bytes(BLOCK * 2)
+    n_blocks = int(seconds / BLOCK_TIME)
+
+    def produce():
+        start = time.monotonic()
+        for i in range(n_blocks):
+            q.put(block)
+            time.sleep(max(0.0, start + (i + 1) * BLOCK_TIME - time.monotonic()))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    decoded = 0
+    while True:
+        try:
+            data, captured = q.get(timeout=0.5)
+        except queue.Empty:
+            break
+        # A fixed cost per call plus a cost growing with the amount of audio, coalesced blocks included.
+        time.sleep(BLOCK_TIME * slowdown / 2 + len(data) / 2 / RATE * slowdown / 2)
+        q.done(captured)
+        decoded += len(data) // 2
+    producer.join()
+    return decoded / (n_blocks * BLOCK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10, help='seconds of audio to produce')
+    parser.add_argument('--slowdown', type=float, default=1.5, help='decoding time / audio time')
+    parser.add_argument('--max-seconds', type=float, default=1.0, help='AudioQueue bound in seconds')
+    args = parser.parse_args()
+
+    maxsize = int(args.max_seconds / BLOCK_TIME)
+    for name, q in [('unbounded queue.Queue', UnboundedQueue()),
+                    ('AudioQueue drop_oldest', AudioQueue(maxsize=maxsize, policy='drop_oldest')),
+                    ('AudioQueue coalesce', AudioQueue(maxsize=maxsize, policy='coalesce'))]:
+        decoded = run(q, args.seconds, args.slowdown)
+        print(f'{name:<24} max lag={q.max_lag:6.2f}s  high water={q.high_water:5d} blocks  '
+              f'decoded={decoded * 100:5.1f}% of the audio')
+
+
+if __name__ == '__main__':
+    main()
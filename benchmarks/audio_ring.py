@@ -0,0 +1,86 @@
+"""Allocations and time per chunk of the Listener audio framing.
+
+"deque" is the old framing of ``Listener.listening``: a deque of ``bytes`` chunks, half of the 2 secs window
+popped and re-appended on every hop, then ``b''.join`` and ``np.frombuffer(...) / 2**15``. "ring" writes each
+chunk into an ``AudioRing`` (``read_from`` does the same write straight from PortAudio) and takes a view of the
+last 2 secs. Feature extraction is left out of both.
+
+Run from the repository root:
+
+    python -m benchmarks.audio_ring [--seconds 60]
+"""
+import argparse
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from utils import CHUNK, RATE, AudioRing
+
+WINDOW = int(2 * RATE / CHUNK)
+# Chunks that fill the buffers first, so only the steady state is measured.
+WARMUP = int(5 * RATE / CHUNK) + WINDOW
+
+
+class DequeFraming:
+    def __init__(self):
+        self.frames = deque([], maxlen=int(5 * RATE / CHUNK))
+        self.window = deque([], maxlen=WINDOW)
+
+    def step(self, chunk):
+        self.frames.append(bytes(chunk))
+        if len(self.frames) > WINDOW:
+            if self.window:
+                for _ in range(WINDOW // 2):
+                    self.window.popleft()
+                for _ in range(WINDOW // 2):
+                    self.window.append(self.frames.popleft())
+            else:
+                while len(self.window) < WINDOW and self.frames:
+                    self.window.append(self.frames.popleft())
+            np.frombuffer(b''.join(self.window), np.int16) / 2 ** 15
+
+
+class RingFraming:
+    def __init__(self):
+        self.ring = AudioRing(5 * RATE)
+
+    def step(self, chunk):
+        self.ring.write(chunk)
+        self.ring.last(WINDOW * CHUNK)
+
+
+def measure(name, framing, chunks):
+    for chunk in chunks[:WARMUP]:
+        framing.step(chunk)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    s = time.perf_counter()
+    for chunk in chunks[WARMUP:]:
+        framing.step(chunk)
+    elapsed = time.perf_counter() - s
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = len(chunks) - WARMUP
+    print(f'{name:<8} {elapsed / n * 1e6:8.2f}us/chunk  peak transient allocation={(peak - before) / 1024:8.1f}KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=60, help='seconds of audio to frame')
+    args = parser.parse_args()
+    if args.seconds * RATE <= WARMUP * CHUNK:
+        parser.error(f'--seconds must be above the {WARMUP * CHUNK / RATE:g} secs of warmup')
+
+    rng = np.random.default_rng(0)
+    audio = rng.integers(-2 ** 12, 2 ** 12, args.seconds * RATE, dtype=np.int16)
+    chunks = [audio[i:i + CHUNK] for i in range(0, len(audio), CHUNK)]
+
+    measure('deque', DequeFraming(), chunks)
+    measure('ring', RingFraming(), chunks)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""CPU versus latency of the vosk block size and accept size.
+
+Replays a recorded wav (16 kHz, mono, int16) through ``RecognitionSession.decode`` in blocks of each
+``--blocks`` size, gathering each accept size of ``--accept`` blocks before calling the recognizer. For
+every combination it reports the CPU time per second of audio and the latency added by blocking: a sample
+waits until its block is delivered and the accept buffer is full, plus the time of the recognizer call.
+
+Run from the repository root:
+
+    python -m benchmarks.block_size --wav recordings/commands.wav [--blocks 200 400 800 1600] [--accept 1 2 4]
+"""
+import argparse
+import time
+import wave
+from importlib import import_module
+
+import vosk
+
+from config import load_config
+from vosk_microphone_pi import RecognitionSession, load_model
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as w:
+        if w.getnchannels() != 1 or w.getsampwidth() != 2:
+            raise ValueError(f'{path}: 16-bit mono wav expected')
+        return w.readframes(w.getnframes()), w.getframerate()
+
+
+def replay(model, cmd_table, d, audio, rate, blocksize, accept_size):
+    session = RecognitionSession(model=model, sample_rate=rate, cmd_table=cmd_table, d=d, chunk=blocksize // 10,
+                                 blocksize=blocksize, accept_size=accept_size)
+    session.rec = vosk.KaldiRecognizer(model, rate, d)
+    calls = []
+    accept = session.rec.AcceptWaveform
+
+    def timed_accept(data):
+        s = time.perf_counter()
+        result = accept(data)
+        calls.append(time.perf_counter() - s)
+        return result
+
+    session.rec.AcceptWaveform = timed_accept
+    commands = []
+    cpu = time.process_time()
+    for i in range(0, len(audio), blocksize * 2):
+        commands += session.decode(audio[i:i + blocksize * 2])
+    cpu = time.process_time() - cpu
+    return cpu, calls, commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', required=True, help='recorded audio to replay')
+    parser.add_argument('--blocks', type=int, nargs='+', default=[200, 400, 800, 1600], help='block sizes')
+    parser.add_argument('--accept', type=int, nargs='+', default=[1, 2, 4], help='blocks per accept call')
+    args = parser.parse_args()
+
+    configs = load_config()
+    table_pkg = import_module(configs['cmd_table']['package'])
+    cmd_table = getattr(table_pkg, configs['cmd_table']['table_name'])
+    d = getattr(table_pkg, configs['cmd_table']['build_dict'])(cmd_table)
+    model = load_model(model=configs['vosk_model_path'])
+    audio, rate = read_wav(args.wav)
+    seconds = len(audio) / 2 / rate
+
+    print(f"{'block':>6} {'accept':>7} {'calls':>6} {'cpu/s audio':>12} {'mean call':>10} {'max latency':>12}  commands")
+    for blocksize in args.blocks:
+        for factor in args.accept:
+            accept_size = blocksize * factor
+            cpu, calls, commands = replay(model, cmd_table, d, audio, rate, blocksize, accept_size)
+            latency = accept_size / rate + max(calls)
+            print(f'{blocksize:>6} {accept_size:>7} {len(calls):>6} {cpu / seconds * 1e3:>10.1f}ms '
+                  f'{sum(calls) / len(calls) * 1e3:>8.2f}ms {latency * 1e3:>10.1f}ms  {len(commands)}')
+
+
+if __name__ == '__main__':
+    main()
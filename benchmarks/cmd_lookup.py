@@ -0,0 +1,55 @@
+"""Scaling of the command lookup with the size of the command table.
+
+Builds synthetic multi-chair/multi-room tables and times the linear scan of ``text2cmd`` against a
+``CommandMatcher`` compiled from the same table.
+
+Run from the repository root:
+
+    python -m benchmarks.cmd_lookup [--sizes 10 100 1000 5000]
+"""
+import argparse
+import random
+import timeit
+
+from common.cmd_lookup import CommandMatcher, cmd_table_en, text2cmd
+
+ROOMS = ['living', 'bed', 'guest', 'office', 'cinema', 'garden', 'attic', 'basement']
+
+
+def synthetic_table(size):
+    """A table of about ``size`` phrases like 'hey chair three living room recliner up'."""
+
+    table = {}
+    i = 0
+    while len(table) < size:
+        room = ROOMS[i % len(ROOMS)]
+        for k, cmd in cmd_table_en.items():
+            table[f'{room} room chair {i} {k}'] = f'{room}_{i}_{cmd}'
+            if len(table) >= size:
+                break
+        i += 1
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('-n', type=int, default=200, help='lookups per measurement')
+    args = parser.parse_args()
+
+    random.seed(0)
+    print(f"{'phrases':>8} {'compile':>12} {'linear scan':>14} {'matcher':>12}")
+    for size in args.sizes:
+        table = synthetic_table(size)
+        keys = list(table)
+        texts = [random.choice(keys) for _ in range(args.n // 2)] + ['hey there nothing to see'] * (args.n // 2)
+
+        compile_time = timeit.timeit(lambda: CommandMatcher(table), number=1)
+        matcher = CommandMatcher(table)
+        linear = timeit.timeit(lambda: [text2cmd(t, table) for t in texts], number=1) / len(texts)
+        compiled = timeit.timeit(lambda: [matcher.match(t) for t in texts], number=1) / len(texts)
+        print(f'{size:>8} {compile_time * 1e3:>10.2f}ms {linear * 1e6:>12.2f}us {compiled * 1e6:>10.2f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Per-hop latency of the DTW wake-up word path, before and after streaming features.
+
+Replays a recorded wav in chunks of ``utils.CHUNK`` samples. "window" recomputes the MFCC of the whole 2 secs
+sliding window and runs a full DTW against the template on every 1 sec hop, as ``Listener.listening`` used to
+(without the silence stripping); "streaming" feeds every chunk to ``StreamingMFCC`` and ``SubsequenceDTW``
+and sums the cost of the chunks of each hop.
+
+Run from the repository root:
+
+    python -m benchmarks.dtw_hop --wav recordings/session.wav --template recordings/template_1.wav
+"""
+import argparse
+import time
+from collections import deque
+
+import librosa
+import numpy as np
+
+from benchmarks.stats import print_summary
+from utils import CHUNK, RATE, StreamingMFCC, SubsequenceDTW, Voice
+
+
+def load_chunks(path):
+    data, _ = librosa.load(path, sr=RATE)
+    data = (data * 2 ** 15).astype(np.int16)
+    return [data[i:i + CHUNK].tobytes() for i in range(0, len(data) - CHUNK + 1, CHUNK)]
+
+
+def bench_window(chunks, template):
+    window_size = int(2 * RATE / CHUNK)
+    window = deque([], maxlen=window_size)
+    samples = []
+    for i, chunk in enumerate(chunks):
+        window.append(chunk)
+        if len(window) == window_size and i % (window_size // 2) == 0:
+            s = time.perf_counter()
+            signal = np.frombuffer(b''.join(window), np.int16) / 2 ** 15
+            Voice(signal).dtw_with(template).normalizedDistance
+            samples.append(time.perf_counter() - s)
+    return samples
+
+
+def bench_streaming(chunks, template):
+    hop = int(RATE / CHUNK)
+    mfcc = StreamingMFCC(rate=RATE)
+    matcher = SubsequenceDTW(mfcc.features(template.wave_data))
+    samples = []
+    elapsed = 0
+    for i, chunk in enumerate(chunks, 1):
+        s = time.perf_counter()
+        matcher.update(mfcc.push(np.frombuffer(chunk, np.int16) / 2 ** 15))
+        elapsed += time.perf_counter() - s
+        if i % hop == 0:
+            samples.append(elapsed)
+            elapsed = 0
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', required=True, help='recorded audio to replay')
+    parser.add_argument('--template', required=True, help='wake-up word template')
+    args = parser.parse_args()
+
+    template = Voice(args.template)
+    chunks = load_chunks(args.wav)
+    # Warm up numba/librosa caches so the first hop is not counted.
+    bench_streaming(chunks[:8], template)
+
+    print_summary('window (per hop)', bench_window(chunks, template))
+    print_summary('streaming (per hop)', bench_streaming(chunks, template))
+
+
+if __name__ == '__main__':
+    main()
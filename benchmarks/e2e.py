@@ -0,0 +1,200 @@
+"""End-to-end replay benchmark of the vosk and DTW paths, no microphone or Pi needed.
+
+Replays a wav file or a folder of wav files (16 kHz, 16-bit mono, one utterance per file) through the
+whole pipeline, with ``WavSource`` in place of the microphone and ``PiRelay.FakeGPIO`` recording the relays.
+
+- As fast as possible: real-time factor (processing time / audio time) and CPU time per second of audio.
+- In real time: latency from the end of each utterance to the first relay write after it (vosk), or to the
+  wake-up (DTW). The end of an utterance is the last 10 ms frame above 10% of its loudest frame.
+
+Utterances that change the relays (e.g. "hey chair recliner up", "stop") give latency figures for vosk.
+"vosk-early" is the vosk path with early commit enabled (see vosk.early_commit in config.yml), so comparing
+it with "vosk" on recordings of "stop" shows the latency saved by firing from the partial result.
+
+With ``--labels``, a text file of ``<wav file name> <expected command>`` lines (``none`` for utterances that
+must not trigger anything), the vosk backends also report the false-trigger rate (utterances followed by a
+command other than the expected one) and the miss rate (expected commands not executed), for each
+``--min-confidence``.
+
+Run from the repository root:
+
+    python -m benchmarks.e2e --replay recordings/commands/ [--backend vosk vosk-early dtw]
+                             [--template t.wav --thresh 25] [--mode vosk|vad|dtw] [--labels recordings/commands/labels.txt]
+                             [--min-confidence 0 0.6 0.8]
+"""
+import argparse
+import copy
+import os
+import time
+import wave
+
+import numpy as np
+
+import PiRelay
+from benchmarks.stats import print_summary
+from common.audio import WavSource
+from config import load_config
+
+RATE = 16000
+
+
+def utterance_ends(source):
+    """The ``time.perf_counter()`` at which the end of each utterance was delivered, in real time."""
+
+    ends = []
+    frame = RATE // 100
+    for path, first, _ in source.segments:
+        with wave.open(path, 'rb') as w:
+            x = np.frombuffer(w.readframes(w.getnframes()), np.int16).astype(np.float32)
+        n = len(x) // frame
+        rms = np.sqrt((x[:n * frame].reshape(n, frame) ** 2).mean(axis=1))
+        last = np.nonzero(rms > 0.1 * rms.max())[0][-1] if n else 0
+        ends.append(source.started_at + (first + (last + 1) * frame) / RATE)
+    return ends
+
+
+def latencies(ends, events):
+    """For every utterance end, the delay to the first event before the next utterance end."""
+
+    samples = []
+    misses = 0
+    for i, end in enumerate(ends):
+        limit = ends[i + 1] if i + 1 < len(ends) else float('inf')
+        after = [t for t in events if end <= t < limit]
+        if after:
+            samples.append(after[0] - end)
+        else:
+            misses += 1
+    return samples, misses
+
+
+def read_labels(path):
+    """{wav file name: expected command}, '' for none."""
+
+    labels = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                name, cmd = line.split()
+                labels[name] = '' if cmd == 'none' else cmd
+    return labels
+
+
+def error_rates(source, commands, labels):
+    """False-trigger and miss rates of the commands executed during each labeled utterance.
+
+    The commands from the start of an utterance to the start of the next one are attributed to it.
+    """
+
+    starts = [source.started_at + first / RATE for _, first, _ in source.segments] + [float('inf')]
+    false_triggers = misses = n = 0
+    for i, (path, _, _) in enumerate(source.segments):
+        expected = labels.get(os.path.basename(path))
+        if expected is None:
+            continue
+        n += 1
+        got = [cmd for t, cmd in commands if starts[i] <= t < starts[i + 1]]
+        if expected and expected not in got:
+            misses += 1
+        if any(cmd != expected for cmd in got):
+            false_triggers += 1
+    return false_triggers, misses, n
+
+
+def run_vosk(configs, path, realtime, early=False, min_confidence=None, mode=None):
+    from main import build_session, cmd_handler
+
+    configs = copy.deepcopy(configs)
+    vosk_configs = configs.setdefault('vosk', {})
+    if early:
+        vosk_configs.setdefault('early_commit', {})['enabled'] = True
+    if min_confidence is not None:
+        vosk_configs['min_confidence'] = min_confidence
+
+    gpio = PiRelay.use_gpio(PiRelay.FakeGPIO())
+    session = build_session(configs, mode)
+    source = WavSource(path, RATE, session.blocksize, realtime=realtime)
+    session.source = source
+    if not realtime:
+        # Nothing may be dropped when the replay runs ahead of the recognizer.
+        session.queue.maxsize = int(source.duration * RATE / session.blocksize) + 1
+    hnd = cmd_handler()
+    commands = []
+    try:
+        session.open()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for cmd in session.commands():
+            commands.append((time.perf_counter(), cmd))
+            hnd.execute(cmd)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        session.close()
+    finally:
+        hnd.shutdown()
+    events = [t for t, _, _ in gpio.calls]
+    return source, wall, cpu, events, commands
+
+
+def run_dtw(configs, path, realtime, template, thresh):
+    from utils import CHUNK, Listener, Voice
+
+    source = WavSource(path, RATE, CHUNK, realtime=realtime)
+    listener = Listener(Voice(template), thresh=thresh, source=source)
+    source.start()
+    events = []
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    while not source.finished:
+        listener.listening()
+        if listener.is_wakeup():
+            events.append(time.perf_counter())
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    return source, wall, cpu, events, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--backend', nargs='+', default=['vosk'], choices=['vosk', 'vosk-early', 'dtw'])
+    parser.add_argument('--template', help='wake-up word template, for dtw')
+    parser.add_argument('--thresh', type=float, help='wake-up threshold, for dtw (see Listener in config.yml)')
+    parser.add_argument('--mode', choices=['vosk', 'vad', 'dtw'], help='first stage of vosk, see config.yml')
+    parser.add_argument('--labels', help='expected command of each wav file, for the vosk error rates')
+    parser.add_argument('--min-confidence', type=float, nargs='+', help='confidence thresholds to compare, for vosk')
+    args = parser.parse_args()
+    if 'dtw' in args.backend and (args.template is None or args.thresh is None):
+        parser.error('the dtw backend needs --template and --thresh')
+
+    configs = load_config()
+    labels = read_labels(args.labels) if args.labels else None
+    for backend in args.backend:
+        if backend in ('vosk', 'vosk-early'):
+            run = lambda realtime: run_vosk(configs, args.replay, realtime, early=backend == 'vosk-early',
+                                            mode=args.mode)
+        else:
+            run = lambda realtime: run_dtw(configs, args.replay, realtime, args.template, args.thresh)
+
+        source, wall, cpu, _, _ = run(realtime=False)
+        print(f'[{backend}] {source.duration:.1f}s of audio, real-time factor {wall / source.duration:.3f}, '
+              f'CPU {cpu / source.duration * 1e3:.1f}ms per second of audio')
+
+        source, _, _, events, _ = run(realtime=True)
+        samples, misses = latencies(utterance_ends(source), events)
+        print_summary(f'[{backend}] utterance end -> ' + ('wake-up' if backend == 'dtw' else 'relay'), samples)
+        print(f'[{backend}] utterances without a reaction: {misses}/{len(source.segments)}')
+
+        if labels is not None and backend != 'dtw':
+            for min_confidence in args.min_confidence or [None]:
+                source, _, _, _, commands = run_vosk(configs, args.replay, True, backend == 'vosk-early',
+                                                     min_confidence, args.mode)
+                false_triggers, misses, n = error_rates(source, commands, labels)
+                threshold = configs.get('vosk', {}).get('min_confidence', 0.0) if min_confidence is None \
+                    else min_confidence
+                print(f'[{backend}] min confidence {threshold:.2f}: false triggers {false_triggers}/{n}, '
+                      f'misses {misses}/{n}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Time and memory per second of audio of the wake-up word front end, float64 against int16/float32.
+
+Replays a recorded wav in chunks of ``utils.CHUNK`` samples through the streaming front end of ``Listener``
+and ``WakeWordGate`` (``StreamingMFCC`` and ``SubsequenceDTW``), and through ``convert_strip`` once per 2 secs
+window. "float64" converts every chunk with ``/ 2 ** 15`` and strips the float64 window, as the path did
+before; "float32" writes the int16 chunks to an ``AudioRing`` that ``StreamingMFCC.consume`` scales into its
+float32 scratch buffer, and strips the int16 window before converting only the speech.
+
+Reported per second of audio: the compute time, and the bytes allocated, as the sum of the tracemalloc peak
+of every chunk (the temporary arrays of a chunk are freed before the next one).
+
+Run from the repository root:
+
+    python -m benchmarks.float32_path --wav recordings/session.wav --template recordings/template_1.wav
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.stats import print_summary
+from utils import CHUNK, RATE, AudioRing, StreamingMFCC, SubsequenceDTW, Voice, convert_strip, strip_silence
+
+WINDOW = int(2 * RATE / CHUNK)
+
+
+def float64_path(template):
+    mfcc = StreamingMFCC(rate=RATE)
+    matcher = SubsequenceDTW(mfcc.features(template.wave_data))
+    window = []
+
+    def step(chunk):
+        matcher.update(mfcc.push(np.frombuffer(chunk, np.int16) / 2 ** 15))
+        window.append(chunk)
+        if len(window) == WINDOW:
+            strip_silence(np.frombuffer(b''.join(window), np.int16) / 2 ** 15, CHUNK, CHUNK // 2)
+            window.clear()
+
+    return step
+
+
+def float32_path(template):
+    audio = AudioRing(RATE)
+    mfcc = StreamingMFCC(rate=RATE)
+    matcher = SubsequenceDTW(mfcc.features(template.wave_data))
+    window = []
+
+    def step(chunk):
+        audio.write(np.frombuffer(chunk, np.int16))
+        matcher.update(mfcc.consume(audio))
+        window.append(chunk)
+        if len(window) == WINDOW:
+            convert_strip(window)
+            window.clear()
+
+    return step
+
+
+def run(path, chunks, template, traced):
+    step = path(template)
+    samples = []
+    for chunk in chunks:
+        if traced:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            step(chunk)
+            samples.append(tracemalloc.get_traced_memory()[1] - current)
+        else:
+            s = time.perf_counter()
+            step(chunk)
+            samples.append(time.perf_counter() - s)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', required=True, help='recorded audio to replay, 16 kHz mono')
+    parser.add_argument('--template', required=True, help='wake-up word template')
+    args = parser.parse_args()
+
+    template = Voice(args.template)
+    data, _ = sf.read(args.wav, dtype='int16')
+    chunks = [data[i:i + CHUNK].tobytes() for i in range(0, len(data) - CHUNK + 1, CHUNK)]
+    seconds = len(chunks) * CHUNK / RATE
+    for name, path in (('float64', float64_path), ('float32', float32_path)):
+        # Warm up numba/librosa caches so the first chunks are not counted.
+        run(path, chunks[:WINDOW], template, traced=False)
+        elapsed = run(path, chunks, template, traced=False)
+        tracemalloc.start()
+        allocated = run(path, chunks, template, traced=True)
+        tracemalloc.stop()
+        print_summary(f'[{name}] per chunk', elapsed)
+        print(f'[{name}] per sec of audio: {sum(elapsed) / seconds * 1e3:.2f}ms, '
+              f'{sum(allocated) / seconds / 2 ** 20:.2f}MiB allocated, '
+              f'peak {max(allocated) / 2 ** 10:.0f}KiB per chunk')
+
+
+if __name__ == '__main__':
+    main()
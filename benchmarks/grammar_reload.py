@@ -0,0 +1,65 @@
+"""Time to reload the command table and grammar, compared with reloading the vosk model.
+
+Measures, ``-n`` times each:
+
+- reload of the table module, ``build_dict`` and compilation of the ``CommandMatcher`` (``TableWatcher.reload``
+  with ``RecognitionSession.set_table`` as callback), in the watcher thread;
+- ``KaldiRecognizer.SetGrammar`` with the new grammar, the only step in the recognizer thread, and a new
+  ``KaldiRecognizer`` for comparison;
+- loading the vosk model, which a restart would cost.
+
+The last two need the vosk model.
+
+Run from the repository root:
+
+    python -m benchmarks.grammar_reload [-n 20]
+"""
+import argparse
+import os
+import time
+
+from benchmarks.stats import print_summary
+from common.reload import TableWatcher
+from config import load_config
+
+RATE = 16000
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        s = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - s)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=20, help='repetitions')
+    args = parser.parse_args()
+
+    configs = load_config()
+    table_configs = configs['cmd_table']
+    from vosk_microphone_pi import RecognitionSession
+
+    watcher = TableWatcher(table_configs['package'], table_configs['table_name'], table_configs['build_dict'])
+    cmd_table, d = watcher.reload()
+    session = RecognitionSession(model=None, sample_rate=RATE, cmd_table=cmd_table, d=d, chunk=20)
+    watcher.callbacks.append(session.set_table)
+    print_summary('table reload + grammar + matcher', timed(watcher.reload, args.n))
+
+    if not os.path.exists(configs['vosk_model_path']):
+        print(f"no model at {configs['vosk_model_path']}, skipping the recognizer and model timings")
+        return
+    import vosk
+    model_load = timed(lambda: vosk.Model(configs['vosk_model_path']), min(args.n, 3))
+    model = vosk.Model(configs['vosk_model_path'])
+    rec = vosk.KaldiRecognizer(model, RATE, d)
+    print_summary('KaldiRecognizer.SetGrammar', timed(lambda: rec.SetGrammar(d), args.n))
+    print_summary('new KaldiRecognizer', timed(lambda: vosk.KaldiRecognizer(model, RATE, d), args.n))
+    print_summary('vosk.Model load', model_load)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Jitter of the audio callback and of the relay steps, with the decoder in a thread or in a worker process.
+
+Replays wav files in real time through the session of config.yml while a motion runs over and over on a fake
+GPIO backend, as ``main.main_loop`` runs a chair. "thread" decodes in this process, as ``main.main_loop``
+does by default; "process" decodes in a ``common.worker.DecoderProcess`` (``isolation.enabled``), and this
+process only copies the audio into the shared ring and drives the relays. Reported for both: how late every
+audio callback ran after its block was complete, and how late every relay step was written after its time
+in the motion plan.
+
+Without the vosk model, ``--standin-ms`` replaces the recognizer by a stand-in that runs that many ms of pure
+Python per block, holding the GIL as the JSON results, the gate and the garbage collector of the decoder do.
+``--rt-priority`` runs this process with a SCHED_FIFO priority in process mode (root needed).
+
+Run from the repository root:
+
+    python -m benchmarks.isolation_jitter --replay recordings/commands/ [--standin-ms 8] [--rt-priority 20]
+"""
+import argparse
+import functools
+import queue
+import threading
+import time
+
+import PiRelay
+from benchmarks.stats import print_summary
+from common.audio import WavSource
+from common.motion import MotionPlan
+from config import load_config
+
+RATE = 16000
+# A motion of short steps, to sample the step timing often.
+MOTION = [{'turn_on': ['RELAY3', 'RELAY4'], 'hold': 0.02}, {'turn_on': ['RELAY1'], 'hold': 0.05}]
+
+
+class TimedSource(WavSource):
+    """WavSource recording how late each callback runs after its block was complete."""
+
+    def start(self, callback=None):
+        self.lateness = []
+
+        def timed(block, frames, time_info, status):
+            self.lateness.append(time.perf_counter() - self.started_at - self._pos / 2 / self.sample_rate)
+            callback(block, frames, time_info, status)
+
+        super().start(timed)
+
+
+class StandInSession:
+    """Stands in for RecognitionSession without a vosk model: busy_ms of pure Python per block."""
+
+    def __init__(self, model=None, source=None, busy_ms=8.0):
+        self.source = source
+        self.busy = busy_ms / 1e3
+        self.queue = queue.Queue()
+        self._closed = False
+
+    def _callback(self, in_data, frames, time_info, status):
+        self.queue.put(bytes(in_data))
+
+    def open(self):
+        self.source.start(callback=self._callback)
+
+    def close(self):
+        self._closed = True
+        self.source.stop()
+
+    def set_table(self, cmd_table, d):
+        pass
+
+    def commands(self):
+        yield from ()
+        while True:
+            try:
+                self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.source.finished or self._closed:
+                    return
+                continue
+            end = time.perf_counter() + self.busy
+            while time.perf_counter() < end:
+                pass
+
+
+def run(args, configs, isolated):
+    from main import VOSK_CHUNK, build_session, cmd_handler
+
+    blocksize = configs.get('vosk', {}).get('blocksize') or VOSK_CHUNK * 10
+    source = TimedSource(args.replay, RATE, blocksize, realtime=True)
+    if args.standin_ms:
+        factory = functools.partial(StandInSession, busy_ms=args.standin_ms)
+    else:
+        factory = functools.partial(build_session, configs, None)
+    decoder = None
+    if isolated:
+        from common.worker import DecoderProcess, set_realtime_priority
+        decoder = DecoderProcess(factory, None if args.standin_ms else configs['vosk_model_path'], [None], RATE,
+                                 blocksize)
+        decoder.start()
+        session = decoder.sessions[0]
+        session.source = source
+        if args.rt_priority:
+            set_realtime_priority(args.rt_priority)
+    else:
+        model = None
+        if not args.standin_ms:
+            from vosk_microphone_pi import load_model
+            model = load_model(configs['vosk_model_path'])
+        session = factory(model=model, source=source)
+
+    hnd = cmd_handler(motions={'recliner_down': MotionPlan('recliner_down', MOTION, repeat=1000)})
+    hnd.execute('hey_chair_recliner_down')
+    session.open()
+    decoding = threading.Thread(target=lambda: list(session.commands()))
+    decoding.start()
+    decoding.join()
+    hnd.shutdown()
+    session.close()
+    if decoder is not None:
+        decoder.stop()
+    label = 'process' if isolated else 'thread'
+    print_summary(f'[{label}] audio callback lateness', source.lateness)
+    print_summary(f'[{label}] relay step lateness', list(hnd.lateness))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--standin-ms', type=float, default=0, help='stand-in decoder, ms of Python per block')
+    parser.add_argument('--rt-priority', type=int, default=0, help='SCHED_FIFO priority in process mode')
+    parser.add_argument('--modes', nargs='+', choices=['thread', 'process'], default=['thread', 'process'])
+    args = parser.parse_args()
+
+    PiRelay.use_gpio(PiRelay.FakeGPIO())
+    configs = load_config()
+    for mode in args.modes:
+        run(args, configs, mode == 'process')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Cost of the per-stage metrics and of debug logging in the hot loops.
+
+Measures, per call:
+
+- ``Histogram.observe`` and ``Counter.inc`` of common/metrics.py, with the two ``perf_counter`` calls around a
+  timed stage;
+- a disabled ``logger.debug`` with an f-string message, as the loops logged before, and with lazy ``%``
+  arguments;
+- an enabled ``logger.debug`` to a null stream, as with ``basicConfig(level=DEBUG)``.
+
+Run from the repository root:
+
+    python -m benchmarks.metrics_overhead [-n 100000]
+"""
+import argparse
+import io
+import logging
+import time
+
+from common import metrics
+
+logger = logging.getLogger('benchmarks.metrics_overhead')
+
+
+def per_call(fn, n):
+    s = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - s) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=100000, help='calls per measurement')
+    args = parser.parse_args()
+
+    hist = metrics.histogram('bench_seconds')
+    count = metrics.counter('bench_total')
+    value = 0.0123
+
+    def timed_stage():
+        s = time.perf_counter()
+        hist.observe(time.perf_counter() - s)
+
+    results = [
+        ('Histogram.observe', per_call(lambda: hist.observe(value), args.n)),
+        ('Counter.inc', per_call(count.inc, args.n)),
+        ('perf_counter x2 + observe', per_call(timed_stage, args.n)),
+    ]
+    logger.setLevel(logging.INFO)
+    results += [
+        ('disabled debug, f-string', per_call(lambda: logger.debug(f'dtw {value:.3f}s {[value] * 4}'), args.n)),
+        ('disabled debug, lazy %', per_call(lambda: logger.debug('dtw %.3fs %s', value, [value] * 4), args.n)),
+    ]
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter('%(asctime)-15s %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    results.append(('enabled debug, formatted', per_call(lambda: logger.debug('dtw %.3fs', value), args.n // 10)))
+
+    for name, t in results:
+        print(f'{name:<32} {t * 1e6:8.3f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""MFCC of a window, librosa against the NumPy front end of common.mfcc: time per window and cold start.
+
+"librosa" is ``librosa.feature.mfcc``, as ``Voice.get_mfcc`` used to compute it; "numpy" is
+``common.mfcc.mfcc(...)``, as it does now. Both compute the MFCC of the same float32 windows of
+``--seconds`` of audio, taken every second of the wav file; the largest difference between their results is
+printed. Cold start is measured in a fresh interpreter for each: the import, plus the first window, which
+loads the lazily imported modules (numba and scipy for librosa) and builds the filterbank.
+
+Run from the repository root:
+
+    python -m benchmarks.mfcc_front_end --wav recordings/session.wav [--seconds 2] [--cold 5]
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.stats import print_summary
+from utils import HOP_LENGTH, N_FFT, N_MFCC, RATE
+
+COLD = {
+    'librosa': '''
+import numpy as np, time
+s = time.perf_counter()
+import librosa
+librosa.feature.mfcc(y=np.zeros({n}, np.float32), sr={rate}, n_mfcc={n_mfcc})
+print(time.perf_counter() - s)
+''',
+    'numpy': '''
+import numpy as np, time
+s = time.perf_counter()
+from common.mfcc import mfcc
+mfcc({rate}, {n_fft}, {hop_length}, {n_mfcc})(np.zeros({n}, np.float32))
+print(time.perf_counter() - s)
+''',
+}
+
+
+def front_ends():
+    import librosa
+    from common.mfcc import mfcc
+
+    native = mfcc(RATE, N_FFT, HOP_LENGTH, N_MFCC)
+    return {
+        'librosa': lambda y: librosa.feature.mfcc(y=y, sr=RATE, n_mfcc=N_MFCC).T,
+        'numpy': native,
+    }
+
+
+def cold_start(name, n):
+    script = COLD[name].format(n=n, rate=RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mfcc=N_MFCC)
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return float(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', required=True, help='recorded audio, 16 kHz mono')
+    parser.add_argument('--seconds', type=float, default=2.0, help='length of a window')
+    parser.add_argument('--cold', type=int, default=5, help='fresh interpreters per front end')
+    args = parser.parse_args()
+
+    data, _ = sf.read(args.wav, dtype='float32')
+    n = int(args.seconds * RATE)
+    windows = [data[i:i + n] for i in range(0, len(data) - n + 1, RATE)]
+    results = {}
+    for name, front_end in front_ends().items():
+        # Warm up, the first call loads and compiles.
+        front_end(windows[0])
+        samples = []
+        results[name] = []
+        for y in windows:
+            s = time.perf_counter()
+            results[name].append(front_end(y))
+            samples.append(time.perf_counter() - s)
+        print_summary(f'[{name}] per window', samples)
+    diff = max(np.abs(a - b).max() for a, b in zip(results['librosa'], results['numpy']))
+    print(f'largest difference: {diff:.2e}')
+    for name in COLD:
+        print_summary(f'[{name}] import + first window', [cold_start(name, n) for _ in range(args.cold)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Timing accuracy of the motion scheduler, on a fake GPIO backend.
+
+Runs every motion of config.yml ``-n`` times to its end through ``cmd_handler`` and reports how late the
+relay steps were written compared to the motion plan, and the error on the duration of the whole motion
+(from ``execute`` to the final all-off write). ``--speed`` divides all the holds, to run the profiles faster.
+
+Run from the repository root, no Pi needed:
+
+    python -m benchmarks.motion_jitter [-n 3] [--speed 1]
+"""
+import argparse
+import time
+
+import PiRelay
+from benchmarks.stats import print_summary
+from common.motion import MotionPlan
+from config import load_config
+
+# The handler command that starts each motion.
+START_CMD = {'recliner_down': 'hey_chair_recliner_down', 'recliner_up': 'hey_chair_recliner_up'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=3, help='runs of every motion')
+    parser.add_argument('--speed', type=float, default=1, help='divide all the holds by this')
+    args = parser.parse_args()
+
+    gpio = PiRelay.use_gpio(PiRelay.FakeGPIO())
+    # Imported after selecting the backend, main only needs it when the handler starts.
+    from main import cmd_handler
+    from common.motion import DEFAULT_MOTIONS
+
+    profiles = load_config().get('motions') or DEFAULT_MOTIONS
+    motions = {name: MotionPlan(name, [dict(step, hold=step.get('hold', 0) / args.speed) for step in p['steps']],
+                                p.get('repeat', 1))
+               for name, p in profiles.items() if name in START_CMD}
+    hnd = cmd_handler(motions=motions)
+    try:
+        for name, plan in motions.items():
+            hnd.lateness.clear()
+            errors = []
+            for _ in range(args.n):
+                s = time.perf_counter()
+                hnd.execute(START_CMD[name])
+                time.sleep(plan.duration + 0.1)
+                errors.append(gpio.calls[-1][0] - s - plan.duration)
+            print_summary(f'[{name}] step lateness', list(hnd.lateness))
+            print_summary(f'[{name}] duration error', errors)
+    finally:
+        hnd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
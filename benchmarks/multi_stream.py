@@ -0,0 +1,77 @@
+"""Memory and CPU of 1 to 4 concurrent recognition sessions sharing one vosk model.
+
+Each session replays the same wav files (16 kHz, 16-bit mono) in real time through its own ``WavSource``,
+recognizer and audio queue, in a thread pool as ``main.main_loop`` runs the chairs. For every number of
+streams, in a fresh interpreter, it reports the resident memory after loading the model and with all the
+sessions open, the CPU load (CPU time / wall time) and the worst audio queue lag of the sessions.
+``--separate-models`` loads one model per session instead, for comparison.
+
+Run from the repository root:
+
+    python -m benchmarks.multi_stream --replay recordings/commands/ [--streams 1 2 3 4] [--separate-models]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.audio import WavSource
+from config import load_config
+
+RATE = 16000
+
+
+def rss():
+    """Resident memory of this process, in MB."""
+
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def run(configs, path, n_streams, separate_models):
+    from main import build_session
+    from vosk_microphone_pi import load_model
+
+    base = rss()
+    models = [load_model(configs['vosk_model_path']) for _ in range(n_streams if separate_models else 1)]
+    model_mb = rss() - base
+    sessions = [build_session(configs, model=models[i % len(models)]) for i in range(n_streams)]
+    for session in sessions:
+        session.source = WavSource(path, RATE, session.blocksize, realtime=True)
+        session.open()
+    open_mb = rss() - base
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with ThreadPoolExecutor(max_workers=n_streams) as pool:
+        for _ in pool.map(lambda session: list(session.commands()), sessions):
+            pass
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    for session in sessions:
+        session.close()
+    lag = max(session.queue.max_lag for session in sessions)
+    print(f'{n_streams} stream(s), {len(models)} model(s): model {model_mb:7.1f}MB, all open {open_mb:7.1f}MB, '
+          f'CPU {cpu / wall * 100:5.1f}%, max lag {lag * 1e3:6.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 2, 3, 4], help='numbers of streams')
+    parser.add_argument('--separate-models', action='store_true', help='one model per session')
+    args = parser.parse_args()
+
+    if len(args.streams) == 1:
+        run(load_config(), args.replay, args.streams[0], args.separate_models)
+        return
+    # A fresh interpreter for every run, memory freed by a run is not always given back to the system.
+    for n in args.streams:
+        cmd = [sys.executable, '-m', 'benchmarks.multi_stream', '--replay', args.replay, '--streams', str(n)]
+        subprocess.run(cmd + (['--separate-models'] if args.separate_models else []), check=True)
+
+
+if __name__ == '__main__':
+    main()
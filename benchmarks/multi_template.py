@@ -0,0 +1,64 @@
+"""Matching one query against many wake-up word templates.
+
+"serial dtw" is the old ``find_closest``: a full ``dtw`` against every template. "bounded" is ``closest_mfcc``
+with lower bounds and early abandon, "bounded pool" the same spread over a process pool with one worker per
+CPU. Templates are the wavs of a folder, or synthetic feature sequences when no folder is given.
+
+Run from the repository root:
+
+    python -m benchmarks.multi_template [--templates recordings/] [-n 20]
+"""
+import argparse
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from dtw import dtw
+
+from benchmarks.stats import print_summary
+from utils import N_MFCC, RATE, StreamingMFCC, Voice, closest_mfcc
+
+
+def synthetic_templates(count, rng):
+    return [rng.standard_normal((rng.integers(40, 80), N_MFCC)) * 10 for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--templates', help='folder of template wav files')
+    parser.add_argument('--count', type=int, default=48, help='number of synthetic templates')
+    parser.add_argument('-n', type=int, default=20, help='queries per measurement')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.templates:
+        mfcc = StreamingMFCC(rate=RATE)
+        templates = [mfcc.features(Voice(p).wave_data) for p in sorted(glob.glob(os.path.join(args.templates,
+                                                                                             '*.wav')))]
+    else:
+        templates = synthetic_templates(args.count, rng)
+    # Queries: a noisy copy of a random template.
+    queries = [t + rng.standard_normal(t.shape) for t in (templates[i] for i in rng.integers(len(templates),
+                                                                                            size=args.n))]
+
+    def run(fn):
+        samples = []
+        for q in queries:
+            s = time.perf_counter()
+            fn(q)
+            samples.append(time.perf_counter() - s)
+        return samples
+
+    print(f'{len(templates)} templates')
+    print_summary('serial dtw', run(lambda q: min(dtw(q, t, dist_method='euclidean').normalizedDistance
+                                                  for t in templates)))
+    print_summary('bounded', run(lambda q: closest_mfcc(q, templates)))
+    with Pool() as pool:
+        closest_mfcc(queries[0], templates, pool=pool)
+        print_summary('bounded pool', run(lambda q: closest_mfcc(q, templates, pool=pool)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""GPIO calls and relay loop time of Relay versus RelayBank, on a fake GPIO backend.
+
+Replays the relay writes of one recliner motion (9 cycles of RELAY3+RELAY4 on, then the motion relay on)
+followed by ``--idle`` idle iterations, without the sleeps:
+
+- ``Relay``: the original loop, which switched all four relays off at the start of every iteration and the
+  motion relays on every cycle, with unconditional writes;
+- ``RelayBank``: the loop of ``main.cmd_handler_task``, which only writes changes, one call per transition.
+
+Reports the number of GPIO output() calls and pins written, and the time per loop iteration with the relay
+logger at ``--log-level``.
+
+Run from the repository root, no Pi needed:
+
+    python -m benchmarks.relay_bank [--idle 60] [--repeat 200] [--log-level WARNING]
+"""
+import argparse
+import time
+
+import PiRelay
+
+CYCLES = 9
+
+
+def unconditional_writes(gpio, idle):
+    """The original loop, with Relay writing every call as it used to."""
+
+    relays = [PiRelay.Relay(name) for name in ('RELAY1', 'RELAY2', 'RELAY3', 'RELAY4')]
+
+    def on(relay):
+        PiRelay.logger.debug(relay.relay + " - ON")
+        gpio.output(relay.pin, gpio.HIGH)
+
+    def off(relay):
+        PiRelay.logger.debug(relay.relay + " - OFF")
+        gpio.output(relay.pin, gpio.LOW)
+
+    def run():
+        for relay in relays:
+            off(relay)
+        for _ in range(CYCLES):
+            on(relays[2])
+            on(relays[3])
+            on(relays[0])
+        for _ in range(idle):
+            for relay in relays:
+                off(relay)
+    return run
+
+
+def relay_bank(gpio, idle):
+    """The loop of cmd_handler_task: the idle handler sleeps on its condition and writes nothing."""
+
+    relays = PiRelay.RelayBank()
+
+    def run():
+        for _ in range(CYCLES):
+            relays.on('RELAY3', 'RELAY4')
+            relays.on('RELAY1')
+        relays.all_off()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--idle', type=int, default=60, help='idle iterations (1 per second in the old loop)')
+    parser.add_argument('--repeat', type=int, default=200, help='motions to time')
+    parser.add_argument('--log-level', default='WARNING', help='level of the PiRelay logger')
+    args = parser.parse_args()
+
+    PiRelay.logger.setLevel(args.log_level)
+    for name, make in [('Relay', unconditional_writes), ('RelayBank', relay_bank)]:
+        gpio = PiRelay.use_gpio(PiRelay.FakeGPIO())
+        run = make(gpio, args.idle)
+        outputs, pins = gpio.outputs, len(gpio.calls)
+        run()
+        outputs, pins = gpio.outputs - outputs, len(gpio.calls) - pins
+
+        s = time.perf_counter()
+        for _ in range(args.repeat):
+            run()
+        elapsed = (time.perf_counter() - s) / args.repeat
+        iterations = CYCLES + 1 + args.idle
+        print(f'{name:<10} per motion + {args.idle} idle iterations: {outputs:4d} output() calls, {pins:4d} pins '
+              f'written, {elapsed / iterations * 1e6:6.2f}us per loop iteration')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""Smoke run of the replay harness as on a box without a microphone: ``benchmarks.e2e`` with no sounddevice.
+
+Makes ``import sounddevice`` fail, as on a host where it (or PortAudio) is not installed, and runs
+``benchmarks.e2e`` on the recordings with the vosk backend, or the backends given. Fails with ImportError if
+anything on the replay path imports sounddevice; only ``MicrophoneSource`` and ``Voice.play`` may.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_smoke --replay recordings/commands/ [--backend vosk vosk-early] [<e2e options>]
+"""
+import argparse
+import runpy
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--backend', nargs='+', default=['vosk'], choices=['vosk', 'vosk-early', 'dtw'])
+    args, e2e_args = parser.parse_known_args()
+
+    # A None entry makes the import raise ImportError.
+    sys.modules['sounddevice'] = None
+    sys.argv = ['benchmarks.e2e', '--replay', args.replay, '--backend', *args.backend, *e2e_args]
+    runpy.run_module('benchmarks.e2e', run_name='__main__', alter_sys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Time from a matched command to being ready for the next one.
+
+Compares the teardown/rebuild cycle of ``action_listen`` (close the stream, build a new ``KaldiRecognizer``,
+open and start a new ``RawInputStream``) with the ``rec.Reset()`` of a ``RecognitionSession``.
+
+Run from the repository root on the target device:
+
+    python -m benchmarks.session_latency [-n 50]
+"""
+import argparse
+import time
+
+import vosk
+import sounddevice as sd
+
+from benchmarks.stats import print_summary
+from config import load_config
+from importlib import import_module
+from common.audio import input_device
+from vosk_microphone_pi import RecognitionSession, load_model, callback
+
+SAMPLE_RATE = 16000
+CHUNK = 20
+
+
+def bench_rebuild(model, d, n):
+    device_name = input_device()['name']
+    samples = []
+    stream = sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=CHUNK * 10, device=device_name, dtype='int16',
+                               channels=1, callback=callback)
+    stream.start()
+    for _ in range(n):
+        s = time.perf_counter()
+        stream.stop()
+        stream.close()
+        vosk.KaldiRecognizer(model, SAMPLE_RATE, d)
+        stream = sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=CHUNK * 10, device=device_name,
+                                   dtype='int16', channels=1, callback=callback)
+        stream.start()
+        samples.append(time.perf_counter() - s)
+    stream.stop()
+    stream.close()
+    return samples
+
+
+def bench_session(model, cmd_table, d, n):
+    samples = []
+    with RecognitionSession(model=model, sample_rate=SAMPLE_RATE, cmd_table=cmd_table, d=d, chunk=CHUNK) as session:
+        for _ in range(n):
+            s = time.perf_counter()
+            session.rec.Reset()
+            samples.append(time.perf_counter() - s)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=50, help='number of command cycles')
+    args = parser.parse_args()
+
+    configs = load_config()
+    table_pkg = import_module(configs['cmd_table']['package'])
+    cmd_table = getattr(table_pkg, configs['cmd_table']['table_name'])
+    d = getattr(table_pkg, configs['cmd_table']['build_dict'])(cmd_table)
+    model = load_model(model=configs['vosk_model_path'])
+
+    print_summary('teardown/rebuild', bench_rebuild(model, d, args.n))
+    print_summary('session rec.Reset()', bench_session(model, cmd_table, d, args.n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Cold start: import times and time to the first recognizer ready.
+
+Import times are taken with ``python -X importtime`` in a fresh interpreter for each module. Time to ready
+is measured from launching a fresh interpreter to ``RecognitionSession.open()`` returning, i.e. model loaded
+and audio stream running; it needs the vosk model and a microphone.
+
+Run from the repository root:
+
+    python -m benchmarks.startup [--modules main vosk_microphone_pi utils] [--no-ready]
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+READY_SCRIPT = '''
+import main
+from config import load_config
+session = main.build_session(load_config())
+session.open()
+print('ready', flush=True)
+session.close()
+'''
+
+
+def import_times(module):
+    """Run ``import module`` with -X importtime and return [(cumulative_us, name)], heaviest first."""
+
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True).stderr
+    times = []
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative), name.strip()))
+    return sorted(times, reverse=True)
+
+
+def time_to_ready():
+    s = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', READY_SCRIPT], stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.strip() == 'ready':
+            elapsed = time.perf_counter() - s
+            break
+    else:
+        elapsed = None
+    proc.wait()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=['main', 'vosk_microphone_pi', 'utils'])
+    parser.add_argument('--top', type=int, default=5, help='heaviest imports to list per module')
+    parser.add_argument('--no-ready', action='store_true', help='skip time to ready (no model/microphone)')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times = import_times(module)
+        total = next((t for t, name in times if name == module), None)
+        if total is None:
+            print(f'import {module}: failed')
+            continue
+        print(f'import {module}: {total / 1000:.1f}ms')
+        for t, name in [(t, name) for t, name in times if name != module][:args.top]:
+            print(f'    {t / 1000:8.1f}ms  {name}')
+
+    if not args.no_ready:
+        elapsed = time_to_ready()
+        print('time to first recognizer ready: ' + ('failed' if elapsed is None else f'{elapsed:.2f}s'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Small helpers shared by the benchmark scripts."""
+
+
+def percentile(samples, p):
+    """Return the p-th percentile (0-100) of samples, using linear interpolation."""
+
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples):
+    """Return a dict of mean/p50/p95/p99/max for samples."""
+
+    n = len(samples)
+    return {
+        'n': n,
+        'mean': sum(samples) / n if n else float('nan'),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples) if n else float('nan'),
+    }
+
+
+def print_summary(name, samples, scale=1000, unit='ms'):
+    """Print one summary line; samples are in seconds and printed in ``unit``."""
+
+    s = summarize(samples)
+    print(f"{name:<32} n={s['n']:<5} mean={s['mean'] * scale:9.3f}{unit} p50={s['p50'] * scale:9.3f}{unit} "
+          f"p95={s['p95'] * scale:9.3f}{unit} p99={s['p99'] * scale:9.3f}{unit} max={s['max'] * scale:9.3f}{unit}")
@@ -0,0 +1,57 @@
+"""Stop latency and idle GPIO traffic of the command handler, on a fake GPIO backend.
+
+Starts a recliner motion, says "stop" at a random point of it and measures the time until the last motion
+relay is switched off. The polling loop this replaced needed up to 1.2 s here and wrote all four pins every
+second while idle.
+
+Run from the repository root, no Pi needed:
+
+    python -m benchmarks.stop_latency [-n 50]
+"""
+import argparse
+import random
+import time
+
+import PiRelay
+from benchmarks.stats import print_summary
+
+
+def wait_all_off(gpio, timeout=2):
+    deadline = time.perf_counter() + timeout
+    while any(gpio.state.values()) and time.perf_counter() < deadline:
+        time.sleep(0.0005)
+    return gpio.calls[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=50, help='number of stop commands')
+    parser.add_argument('--idle', type=float, default=3, help='seconds of idle time to count GPIO writes over')
+    args = parser.parse_args()
+
+    gpio = PiRelay.use_gpio(PiRelay.FakeGPIO())
+    # Imported after selecting the backend, main only needs it when the handler starts.
+    from main import cmd_handler
+
+    hnd = cmd_handler()
+    samples = []
+    try:
+        for _ in range(args.n):
+            hnd.execute('hey_chair_recliner_down')
+            time.sleep(random.uniform(0.05, 1.5))
+            s = time.perf_counter()
+            hnd.execute('stop')
+            samples.append(wait_all_off(gpio) - s)
+
+        n_calls = len(gpio.calls)
+        time.sleep(args.idle)
+        idle_writes = len(gpio.calls) - n_calls
+    finally:
+        hnd.shutdown()
+
+    print_summary('stop -> relays off', samples)
+    print(f'GPIO writes while idle: {idle_writes / args.idle:.2f}/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Time of utils.strip_silence against librosa.effects.trim on 2 sec windows.
+
+Slides a 2 sec window over a recorded wav, by 1 sec hops like the multi-template ``Listener``, and cuts the
+silence of every window with both. The bounds found by both are compared too: librosa cuts at 60 dB below the
+loudest frame, ``strip_silence`` at ``STRIP_MARGIN_DB`` above the noise floor of the window.
+
+Run from the repository root:
+
+    python -m benchmarks.strip_silence --wav recordings/session.wav
+"""
+import argparse
+import time
+
+import librosa
+import numpy as np
+
+from benchmarks.stats import print_summary
+from utils import RATE, strip_silence
+
+
+def windows(path):
+    data, _ = librosa.load(path, sr=RATE)
+    return [data[i:i + 2 * RATE] for i in range(0, len(data) - 2 * RATE + 1, RATE)]
+
+
+def timed(fn, items):
+    samples, results = [], []
+    for item in items:
+        s = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - s)
+    return samples, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wav', required=True, help='recording to slide the windows over')
+    args = parser.parse_args()
+
+    items = windows(args.wav)
+    # Warm up librosa, its first call compiles with numba.
+    librosa.effects.trim(items[0])
+    fast, stripped = timed(strip_silence, items)
+    slow, trimmed = timed(lambda y: librosa.effects.trim(y)[1], items)
+    print_summary('strip_silence', fast)
+    print_summary('librosa.effects.trim', slow)
+
+    base = [np.lib.array_utils.byte_bounds(w)[0] for w in items]
+    for label, bounds in (('strip_silence', [(np.lib.array_utils.byte_bounds(x)[0] - b) // 4 for x, b in zip(stripped, base)]),
+                          ('librosa.effects.trim', [i for i, _ in trimmed])):
+        print(f'{label:<32} mean start={np.mean(bounds) / RATE:.3f}s')
+    kept = [len(x) / (2 * RATE) for x in stripped]
+    print(f'strip_silence keeps {np.mean(kept):.0%} of the windows, {sum(not k for k in kept)} windows silent; '
+          f'librosa.effects.trim keeps {np.mean([(e - s) / (2 * RATE) for s, e in trimmed]):.0%}')
+
+
+if __name__ == '__main__':
+    main()
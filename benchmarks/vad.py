@@ -0,0 +1,114 @@
+"""Idle CPU and recall of the first stage in front of the vosk recognizer.
+
+Replays wav files (16 kHz, 16-bit mono, one utterance per file, with ``WavSource``'s silence in between) and
+``--idle`` seconds of quiet room noise through the gate of each ``--modes`` (see ``main.build_gate``: ``vad``
+is ``EnergyVAD``, ``dtw`` the wake-up word template) in blocks of the vosk block size, and reports:
+
+- the share of the audio passed to the recognizer and the CPU time of the gate per second of audio;
+- recall of the gate: utterances whose speech (frames above 10% of the loudest frame of the file) was passed
+  whole, and utterances with a clipped onset. For ``dtw`` the recordings should start with the wake-up word.
+
+With ``--decode`` (needs the vosk model), the audio is also decoded with and without the gate, giving the
+decoder CPU time per second of audio, idle included, and the commands recognized both ways.
+
+Run from the repository root:
+
+    python -m benchmarks.vad --replay recordings/commands/ [--modes vad dtw] [--idle 30] [--noise-db -60] [--decode]
+"""
+import argparse
+import time
+from importlib import import_module
+
+import numpy as np
+
+from common.audio import WavSource
+from config import load_config
+from main import build_gate
+
+RATE = 16000
+
+
+def speech_spans(source):
+    """(first, last) sample of the speech of every file in the replayed audio."""
+
+    audio = np.frombuffer(source._audio, np.int16).astype(np.float32)
+    frame = RATE // 100
+    spans = []
+    for _, first, n in source.segments:
+        x = audio[first:first + n // frame * frame].reshape(-1, frame)
+        rms = np.sqrt((x ** 2).mean(axis=1))
+        speech = np.nonzero(rms > 0.1 * rms.max())[0]
+        spans.append((first + speech[0] * frame, first + (speech[-1] + 1) * frame))
+    return spans
+
+
+def run_gate(gate, audio, blocksize):
+    """Run the gate over audio, returning the mask of passed samples and the CPU time."""
+
+    passed = np.zeros(len(audio) // 2, bool)
+    step = blocksize * 2
+    cpu = time.process_time()
+    for i in range(0, len(audio), step):
+        out = gate.filter(audio[i:i + step])
+        if out:
+            end = (i + step) // 2
+            passed[end - len(out) // 2:end] = True
+    return passed, time.process_time() - cpu
+
+
+def decode(configs, audio, blocksize, gate):
+    import vosk
+    from vosk_microphone_pi import RecognitionSession, load_model
+
+    table_pkg = import_module(configs['cmd_table']['package'])
+    cmd_table = getattr(table_pkg, configs['cmd_table']['table_name'])
+    d = getattr(table_pkg, configs['cmd_table']['build_dict'])(cmd_table)
+    session = RecognitionSession(model=None, sample_rate=RATE, cmd_table=cmd_table, d=d, chunk=blocksize // 10,
+                                 blocksize=blocksize, accept_size=configs.get('vosk', {}).get('accept_size'),
+                                 gate=gate)
+    session.rec = vosk.KaldiRecognizer(load_model(configs['vosk_model_path']), RATE, d)
+    commands = []
+    cpu = time.process_time()
+    for i in range(0, len(audio), blocksize * 2):
+        commands += session.decode(audio[i:i + blocksize * 2])
+    return commands, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', required=True, help='wav file or folder of wav files')
+    parser.add_argument('--modes', nargs='+', default=['vad'], choices=['vad', 'dtw'], help='first stages to compare')
+    parser.add_argument('--idle', type=float, default=30, help='seconds of room noise to replay')
+    parser.add_argument('--noise-db', type=float, default=-60, help='level of the room noise, dBFS')
+    parser.add_argument('--decode', action='store_true', help='also decode with vosk (needs the model)')
+    args = parser.parse_args()
+
+    configs = load_config()
+    blocksize = configs.get('vosk', {}).get('blocksize', 800)
+
+    source = WavSource(args.replay, RATE, blocksize, realtime=False)
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, 10 ** (args.noise_db / 20) * 2 ** 15, int(args.idle * RATE))
+    idle = np.clip(noise, -2 ** 15, 2 ** 15 - 1).astype(np.int16).tobytes()
+
+    for name, audio in [('idle', idle), ('recordings', source._audio)]:
+        seconds = len(audio) / 2 / RATE
+        for mode in args.modes:
+            passed, cpu = run_gate(build_gate(configs, mode, RATE), audio, blocksize)
+            print(f'[{name}] [{mode}] {seconds:.1f}s of audio, passed {passed.mean() * 100:.1f}%, '
+                  f'gate CPU {cpu / seconds * 1e3:.2f}ms per second of audio')
+            if name == 'recordings':
+                spans = speech_spans(source)
+                whole = sum(passed[a:b].all() for a, b in spans)
+                clipped = sum(not passed[a] for a, b in spans)
+                print(f'[{name}] [{mode}] utterances passed whole: {whole}/{len(spans)}, clipped onsets: {clipped}')
+
+        if args.decode:
+            for mode in ['vosk'] + args.modes:
+                commands, cpu = decode(configs, audio, blocksize, build_gate(configs, mode, RATE))
+                print(f'[{name}] [{mode}] decoder CPU {cpu / seconds * 1e3:6.1f}ms per second of audio, '
+                      f'commands: {commands}')
+
+
+if __name__ == '__main__':
+    main()
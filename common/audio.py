@@ -0,0 +1,359 @@
+import functools
+import os
+import queue
+import logging
+import threading
+import time
+import wave
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def input_device(device=None):
+    """Query an audio input device, once.
+
+    Parameters
+    ----------
+    device : int, str
+        The index or (part of the) name of the device, the default input device if None.
+
+    Returns
+    -------
+    device : dict
+        The device info from ``sounddevice.query_devices``.
+    """
+
+    import sounddevice as sd
+    info = sd.query_devices(device, kind='input')
+    logger.info(info)
+    return info
+
+
+class MicrophoneSource:
+    """Audio from an input device, through sounddevice.
+
+    Audio sources are started either with a callback, called from another thread with
+    ``(in_data, frames, time, status)`` for every block like a sounddevice callback, or without one and
+    then read with ``read_into``.
+
+    Attributes
+    ----------
+    sample_rate : int
+        The sample rate of the audio.
+
+    blocksize : int
+        Samples per block.
+
+    device : int, str
+        The input device, see ``input_device``. The default input device if None.
+
+    finished : bool
+        Whether the source ran out of audio, never for a microphone.
+    """
+
+    def __init__(self, sample_rate, blocksize, device=None):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.device = device
+        self.finished = False
+        self._stream = None
+
+    def start(self, callback=None):
+        import sounddevice as sd
+        self._stream = sd.RawInputStream(samplerate=self.sample_rate, blocksize=self.blocksize,
+                                         device=input_device(self.device)['name'], dtype='int16', channels=1,
+                                         callback=callback)
+        self._stream.start()
+
+    def read_into(self, out):
+        """Read len(out) samples of a source started without callback directly into out.
+
+        Returns
+        -------
+        overflowed : bool
+            True if input data was discarded since the previous read.
+        """
+
+        import sounddevice as sd
+        lib, ffi, ptr = getattr(sd, '_lib', None), getattr(sd, '_ffi', None), getattr(self._stream, '_ptr', None)
+        if lib is None or ffi is None or ptr is None or not hasattr(sd, '_check'):
+            # The internals below are gone (see requirements.txt), read through the public API and copy.
+            data, overflowed = self._stream.read(len(out))
+            memoryview(out).cast('B')[:] = data
+            return overflowed
+        # RawInputStream.read() allocates a new buffer for every call, so go to PortAudio directly.
+        err = lib.Pa_ReadStream(ptr, ffi.from_buffer(out), len(out))
+        overflowed = err == lib.paInputOverflowed
+        if not overflowed:
+            sd._check(err)
+        return overflowed
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class WavSource:
+    """Replays wav files as if they came from a microphone.
+
+    The files (16-bit mono, at ``sample_rate``) are played one after another with ``gap`` seconds of silence
+    in between, either in real time or as fast as they are consumed.
+
+    Attributes
+    ----------
+    sample_rate : int
+        The sample rate of the audio.
+
+    blocksize : int
+        Samples per block passed to the callback.
+
+    realtime : bool
+        Deliver blocks at the pace of the audio, instead of as fast as possible.
+
+    segments : list
+        (path, first sample, number of samples) of every file in the replayed audio.
+
+    started_at : float
+        The ``time.perf_counter()`` the replay started at; in real time sample i is delivered at
+        ``started_at + i / sample_rate`` at the earliest.
+
+    finished : bool
+        Whether all the audio has been delivered.
+    """
+
+    def __init__(self, path, sample_rate, blocksize, realtime=True, gap=2.0):
+        """Constructor of class WavSource.
+
+        Parameters
+        ----------
+        path : str, list
+            A wav file, a folder of wav files (played in name order) or a list of wav files.
+        """
+
+        if isinstance(path, str):
+            paths = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.wav')) \
+                if os.path.isdir(path) else [path]
+        else:
+            paths = list(path)
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self.segments = []
+        self.started_at = None
+        self.finished = False
+
+        silence = bytes(int(gap * sample_rate) * 2)
+        chunks = []
+        n = 0
+        for p in paths:
+            with wave.open(p, 'rb') as w:
+                if w.getnchannels() != 1 or w.getsampwidth() != 2 or w.getframerate() != sample_rate:
+                    raise ValueError(f'{p}: 16-bit mono wav at {sample_rate} Hz expected')
+                data = w.readframes(w.getnframes())
+            self.segments.append((p, n, len(data) // 2))
+            chunks += [data, silence]
+            n += (len(data) + len(silence)) // 2
+        self._audio = b''.join(chunks)
+        self._pos = 0
+        self._thread = None
+        self._running = False
+
+    @property
+    def duration(self):
+        """Seconds of audio replayed."""
+
+        return len(self._audio) / 2 / self.sample_rate
+
+    def _wait(self, end):
+        # Block until the audio up to the end sample would have been captured.
+        if self.realtime:
+            delay = self.started_at + end / self.sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def start(self, callback=None):
+        self.started_at = time.perf_counter()
+        self._pos = 0
+        self.finished = False
+        self._running = True
+        if callback is not None:
+            self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+            self._thread.start()
+
+    def _run(self, callback):
+        step = self.blocksize * 2
+        while self._running and self._pos < len(self._audio):
+            block = self._audio[self._pos:self._pos + step]
+            self._pos += len(block)
+            self._wait(self._pos // 2)
+            callback(block, len(block) // 2, None, None)
+        self.finished = True
+
+    def read_into(self, out):
+        """Copy the next len(out) samples into out.
+
+        Raises
+        ------
+        EOFError:
+            When all the audio has been read.
+        """
+
+        n = len(out) * 2
+        if self._pos + n > len(self._audio):
+            self.finished = True
+            raise EOFError('end of replayed audio')
+        memoryview(out).cast('B')[:] = self._audio[self._pos:self._pos + n]
+        self._pos += n
+        self._wait(self._pos // 2)
+        return False
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class AudioQueue:
+    """Bounded queue of audio blocks between the audio callback and the recognizer.
+
+    At most ``maxsize`` blocks of audio are queued; when the recognizer falls behind, the oldest audio is
+    dropped so that it catches up with the latest audio and the lag stays bounded. With the ``coalesce``
+    policy, a block arriving while others are still queued is appended to the newest queued one (up to
+    ``coalesce_limit`` blocks), so a recognizer that fell behind is called fewer times for the same audio.
+
+    Attributes
+    ----------
+    maxsize : int
+        The maximum number of blocks of audio queued.
+
+    policy : str
+        'drop_oldest' or 'coalesce'.
+
+    overruns : int
+        The number of times audio was dropped because the queue was full.
+
+    dropped : int
+        The number of blocks dropped.
+
+    coalesced : int
+        The number of blocks appended to a queued block.
+
+    input_overflows : int
+        The number of callbacks flagged with an input overflow by PortAudio.
+
+    high_water : int
+        The highest number of blocks of audio queued.
+
+    lag : float
+        Seconds from the capture of the last decoded block to the recognizer being done with it.
+
+    max_lag : float
+        The highest ``lag`` seen.
+    """
+
+    POLICIES = ('drop_oldest', 'coalesce')
+
+    def __init__(self, maxsize=80, policy='drop_oldest', coalesce_limit=8):
+        if policy not in self.POLICIES:
+            raise ValueError(f'unknown audio queue policy: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce_limit = min(coalesce_limit, maxsize)
+        # [data, capture time, number of blocks in data]
+        self._blocks = deque()
+        self._size = 0
+        self._cv = threading.Condition()
+        self.overruns = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.input_overflows = 0
+        self.high_water = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def put(self, data, status=None):
+        """Queue a block of audio data, normally from the audio callback.
+
+        Parameters
+        ----------
+        data : bytes, buffer
+            The audio block. It is copied.
+
+        status : sounddevice.CallbackFlags
+            The status passed to the callback.
+        """
+
+        now = time.monotonic()
+        with self._cv:
+            if status:
+                self.input_overflows += 1
+            if self.policy == 'coalesce' and self._blocks and self._blocks[-1][2] < self.coalesce_limit:
+                tail = self._blocks[-1]
+                tail[0] += bytes(data)
+                tail[1] = now
+                tail[2] += 1
+                self.coalesced += 1
+            else:
+                self._blocks.append([bytes(data), now, 1])
+            self._size += 1
+            if self._size > self.maxsize:
+                self.overruns += 1
+                while self._size > self.maxsize:
+                    n = self._blocks.popleft()[2]
+                    self._size -= n
+                    self.dropped += n
+            self.high_water = max(self.high_water, self._size)
+            self._cv.notify()
+
+    def get(self, timeout=None):
+        """Take the oldest block.
+
+        Returns
+        -------
+        data : bytes
+            The audio data.
+
+        captured : float
+            The ``time.monotonic()`` of the capture of the end of data.
+
+        Raises
+        ------
+        queue.Empty:
+            When no block arrived within timeout.
+        """
+
+        with self._cv:
+            if not self._cv.wait_for(lambda: self._blocks, timeout):
+                raise queue.Empty
+            data, captured, n = self._blocks.popleft()
+            self._size -= n
+        return data, captured
+
+    def done(self, captured):
+        """Record that the recognizer is done with the block captured at ``captured``."""
+
+        self.lag = time.monotonic() - captured
+        if self.lag > self.max_lag:
+            self.max_lag = self.lag
+
+    def qsize(self):
+        return self._size
+
+    def stats(self):
+        """The counters of the queue, as a dict."""
+
+        return {
+            'depth': self._size,
+            'high_water': self.high_water,
+            'overruns': self.overruns,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'input_overflows': self.input_overflows,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+        }
@@ -1,4 +1,7 @@
 
+from collections import deque
+
+
 # ===================================== English(en-us) ====================================
 cmd_table_en = {
     'hey chair recliner down': 'hey_chair_recliner_down',
@@ -53,16 +56,109 @@ def text2cmd(text, cmd_table):
     text : str
         The result from vosk model after speech recognition.
 
-    cmd_table : dict{ str:str }
-        Description as above.
+    cmd_table : dict{ str:str }, CommandMatcher
+        Description as above. A CommandMatcher compiled from the table is matched in a single pass.
 
     Returns
     -------
     An str. The corresponding Petoi command.
     """
 
+    if isinstance(cmd_table, CommandMatcher):
+        return cmd_table.match(text)
+
     for k in cmd_table.keys():
         if (text.find(k) > -1):
             return cmd_table.get(k, '')
 
     return ''
+
+
+class CommandMatcher:
+    """Command matcher compiled once from a cmd_table.
+
+    The keys of the table are compiled into an Aho-Corasick automaton over words, so a recognized text is
+    matched against every key in a single pass, independent of the size of the table. Unlike the linear
+    scan of ``text2cmd``, the result does not depend on the order of the table: the longest key (in words)
+    found in the text wins, and among keys of equal length the one that ends first.
+
+    Attributes
+    ----------
+    cmd_table : dict{ str:str }
+        The table the matcher was compiled from.
+    """
+
+    def __init__(self, cmd_table):
+        self.cmd_table = cmd_table
+        # Per state: goto transitions, failure link and the longest (n_words, cmd) key ending in the state.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+
+        for k, cmd in cmd_table.items():
+            words = k.split()
+            if not words:
+                continue
+            state = 0
+            for w in words:
+                nxt = self._goto[state].get(w)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][w] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                state = nxt
+            if self._out[state] is None:
+                self._out[state] = (len(words), cmd)
+
+        # Breadth-first, so the failure link of a state is complete before its children need it.
+        todo = deque(self._goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for w, nxt in self._goto[state].items():
+                f = self._fail[state]
+                while f and w not in self._goto[f]:
+                    f = self._fail[f]
+                f = self._goto[f].get(w, 0)
+                self._fail[nxt] = f
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[f]
+                todo.append(nxt)
+
+    def match(self, text):
+        """Find the command of the longest key contained in text.
+
+        Parameters
+        ----------
+        text : str
+            The result from vosk model after speech recognition.
+
+        Returns
+        -------
+        An str. The corresponding command, '' if no key is found.
+        """
+
+        goto, fail, out = self._goto, self._fail, self._out
+        best = None
+        state = 0
+        for w in text.split():
+            while state and w not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(w, 0)
+            found = out[state]
+            if found is not None and (best is None or found[0] > best[0]):
+                best = found
+        return best[1] if best else ''
+
+    def unambiguous(self, cmd):
+        """Whether a match of cmd can only grow into cmd.
+
+        True if every key containing a key of cmd maps to cmd as well, so that a partial recognition of a
+        key of cmd will not turn out to be another command once the utterance is complete.
+        """
+
+        keys = [f' {" ".join(k.split())} ' for k in self.cmd_table]
+        own = [k for k, c in zip(keys, self.cmd_table.values()) if c == cmd]
+        return bool(own) and all(c == cmd for k2, c in zip(keys, self.cmd_table.values())
+                                 if any(k in k2 for k in own))
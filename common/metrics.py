@@ -0,0 +1,207 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets in seconds, from 10 us to 2.5 s.
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5)
+
+# All the metrics by name.
+REGISTRY = {}
+
+
+class Counter:
+    """A count that only goes up.
+
+    Updates are not locked, every stage updates its metrics from its own thread; an update lost to a race
+    between threads is acceptable for monitoring.
+
+    Attributes
+    ----------
+    name, help : str
+        The Prometheus name and description of the metric.
+
+    value : float
+        The count.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self):
+        return [(self.name, '', self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Distribution of observed values, seconds for the stage timings, in fixed buckets.
+
+    Observing costs one binary search and three additions; nothing is allocated.
+
+    Attributes
+    ----------
+    buckets : tuple
+        The upper bounds of the buckets, increasing.
+
+    counts : list
+        The number of observations in each bucket, the last one for the values above all the bounds.
+
+    count, sum : int, float
+        The number and sum of all the observations.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate of the q quantile: the upper bound of the bucket holding it, None before any observation."""
+
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        samples = []
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            samples.append((f'{self.name}_bucket', f'{{le="{"+Inf" if bound == float("inf") else bound}"}}', seen))
+        samples += [(f'{self.name}_count', '', self.count), (f'{self.name}_sum', '', self.sum)]
+        return samples
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+
+def _get(cls, name, help, **kwargs):
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = cls(name, help, **kwargs)
+    return metric
+
+
+def counter(name, help=''):
+    """The counter called name, created on first use."""
+
+    return _get(Counter, name, help)
+
+
+def histogram(name, help='', buckets=DEFAULT_BUCKETS):
+    """The histogram called name, created on first use."""
+
+    return _get(Histogram, name, help, buckets=buckets)
+
+
+def render_prometheus():
+    """All the metrics in the Prometheus text exposition format."""
+
+    lines = []
+    for metric in list(REGISTRY.values()):
+        lines += [f'# HELP {metric.name} {metric.help}', f'# TYPE {metric.name} {metric.kind}']
+        lines += [f'{name}{labels} {value}' for name, labels, value in metric.samples()]
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """All the metrics as a dict, counters by value and histograms by count, sum and p50/p99 estimates."""
+
+    return {name: metric.snapshot() for name, metric in list(REGISTRY.items())}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = render_prometheus().encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(snapshot()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread.
+
+    Returns
+    -------
+    server : http.server.ThreadingHTTPServer
+        Call ``shutdown()`` on it to stop serving.
+    """
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f'metrics on http://{host}:{server.server_port}/metrics')
+    return server
+
+
+class JsonDumper:
+    """Writes ``snapshot()`` to a file every ``interval`` seconds, from a daemon thread.
+
+    The file is replaced atomically, so readers never see a partial dump.
+    """
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-json', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.dump()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'time': time.time(), 'metrics': snapshot()}, f, indent=1)
+        os.replace(tmp, self.path)
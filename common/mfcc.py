@@ -0,0 +1,150 @@
+import functools
+
+import numpy as np
+
+
+def hz_to_mel(freqs):
+    """Hz to mels on the Slaney scale: linear below 1 kHz, logarithmic above, as librosa with htk=False."""
+
+    freqs = np.asanyarray(freqs, dtype=np.float64)
+    log_mels = 15 + np.log(np.maximum(freqs, 1000) / 1000) / (np.log(6.4) / 27)
+    return np.where(freqs >= 1000, log_mels, freqs * 3 / 200)
+
+
+def mel_to_hz(mels):
+    """The inverse of ``hz_to_mel``."""
+
+    mels = np.asanyarray(mels, dtype=np.float64)
+    return np.where(mels >= 15, 1000 * np.exp(np.log(6.4) / 27 * (mels - 15)), mels * 200 / 3)
+
+
+def mel_filterbank(rate, n_fft, n_mels=128):
+    """Triangular mel filters from 0 Hz to the Nyquist frequency, area normalized (Slaney).
+
+    The same weights as ``librosa.filters.mel(sr=rate, n_fft=n_fft, n_mels=n_mels)``.
+
+    Returns
+    -------
+    weights : np.ndarray [shape=(n_mels, 1 + n_fft // 2)]
+        float32 weight of every FFT bin in every mel band.
+    """
+
+    fft_freqs = np.fft.rfftfreq(n_fft, 1 / rate)
+    mel_freqs = mel_to_hz(np.linspace(0, hz_to_mel(rate / 2), n_mels + 2))
+    ramps = mel_freqs[:, None] - fft_freqs[None, :]
+    widths = np.diff(mel_freqs)
+    lower = -ramps[:-2] / widths[:-1, None]
+    upper = ramps[2:] / widths[1:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    weights *= (2 / (mel_freqs[2:] - mel_freqs[:-2]))[:, None]
+    return weights.astype(np.float32)
+
+
+def dct_basis(n_mfcc, n_mels):
+    """Rows of the orthonormal DCT-II, ``scipy.fft.dct(x, type=2, norm='ortho')[:n_mfcc]`` as a matmul.
+
+    Returns
+    -------
+    basis : np.ndarray [shape=(n_mfcc, n_mels)]
+    """
+
+    k = np.arange(n_mfcc)[:, None]
+    n = np.arange(n_mels)[None, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2 / n_mels)
+    basis[0] /= np.sqrt(2)
+    return basis.astype(np.float32)
+
+
+class MFCC:
+    """MFCC front end in plain NumPy, with everything that does not depend on the signal computed once.
+
+    The frames of a signal are a strided view on it; they are windowed and transformed by one batched
+    ``rfft`` call, and the mel bands and the DCT are two matmuls. The results are those of
+    ``librosa.feature.mfcc`` (Hann window, Slaney mel filters, power in dB, orthonormal DCT-II) within
+    float32 rounding, without importing librosa, scipy or numba. Use ``mfcc()`` to share one instance per
+    set of parameters.
+
+    Attributes
+    ----------
+    rate, n_fft, hop_length, n_mfcc : int
+        The sample rate, the FFT window and the hop between frames (in samples), the coefficients per frame.
+
+    window : np.ndarray [shape=(n_fft,)]
+        The periodic Hann window.
+
+    mel_basis : np.ndarray [shape=(n_mels, 1 + n_fft // 2)]
+        The mel filterbank, see ``mel_filterbank``.
+
+    dct_basis : np.ndarray [shape=(n_mfcc, n_mels)]
+        See ``dct_basis``.
+    """
+
+    def __init__(self, rate, n_fft=2048, hop_length=512, n_mfcc=20, n_mels=128):
+        self.rate = rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mfcc = n_mfcc
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+        self.mel_basis = mel_filterbank(rate, n_fft, n_mels)
+        self.dct_basis = dct_basis(n_mfcc, n_mels)
+
+    def power(self, y, center=True):
+        """Power spectrum of every frame of y.
+
+        Parameters
+        ----------
+        y : np.ndarray
+            float32 wave data (float64 is analysed in float64).
+
+        center : bool
+            Pad y with ``n_fft // 2`` zeros on both sides so that frame t is centered on sample
+            ``t * hop_length``, as librosa does by default; else frames start at ``t * hop_length``.
+
+        Returns
+        -------
+        power : np.ndarray [shape=(t, 1 + n_fft // 2)]
+        """
+
+        if center:
+            y = np.pad(y, self.n_fft // 2)
+        if len(y) < self.n_fft:
+            return np.zeros((0, self.n_fft // 2 + 1), y.dtype)
+        frames = np.lib.stride_tricks.sliding_window_view(y, self.n_fft)[::self.hop_length]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        power = spectrum.real ** 2
+        power += spectrum.imag ** 2
+        return power
+
+    def __call__(self, y, center=True, top_db=80.0):
+        """Compute the MFCC frames of a signal.
+
+        Parameters
+        ----------
+        y : np.ndarray
+            float32 wave data.
+
+        center : bool
+            See ``power``.
+
+        top_db : float
+            Clip the dB scale to ``top_db`` below the loudest mel band of the signal, None not to clip.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            MFCC sequence
+        """
+
+        mel = self.power(y, center) @ self.mel_basis.T
+        db = np.log10(np.maximum(mel, 1e-10, out=mel), out=mel)
+        db *= 10
+        if top_db is not None and len(db):
+            np.maximum(db, db.max() - top_db, out=db)
+        return db @ self.dct_basis.T
+
+
+@functools.lru_cache(maxsize=None)
+def mfcc(rate, n_fft=2048, hop_length=512, n_mfcc=20):
+    """The shared ``MFCC`` front end of these parameters, created on first use."""
+
+    return MFCC(rate, n_fft, hop_length, n_mfcc)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+import PiRelay
+
+logger = logging.getLogger(__name__)
+
+# The keys of a step. Not on/off, which YAML reads as booleans.
+STEP_KEYS = {'turn_on', 'turn_off', 'hold'}
+# The motions used when config.yml has none: RELAY3 and RELAY4 are energised first, then the relay of the
+# direction, 9 times over.
+DEFAULT_MOTIONS = {
+    'recliner_down': {'repeat': 9, 'steps': [{'turn_on': ['RELAY3', 'RELAY4'], 'hold': 0.2},
+                                             {'turn_on': ['RELAY1'], 'hold': 1.0}]},
+    'recliner_up': {'repeat': 9, 'steps': [{'turn_on': ['RELAY3', 'RELAY4'], 'hold': 0.2},
+                                           {'turn_on': ['RELAY2'], 'hold': 1.0}]},
+}
+
+
+class MotionPlan:
+    """A motion profile compiled into relay steps at fixed times from the start of the motion.
+
+    A profile is a list of steps, each switching some relays on and some off and then holding for some
+    seconds, repeated ``repeat`` times. All the relays are switched off at the end of the motion.
+
+    Attributes
+    ----------
+    name : str
+        The command name of the motion.
+
+    steps : list
+        (offset, relays on, relays off) of every step, offset in seconds from the start of the motion.
+
+    duration : float
+        Seconds from the start of the motion to its end.
+    """
+
+    def __init__(self, name, steps, repeat=1):
+        """Constructor of class MotionPlan.
+
+        Parameters
+        ----------
+        steps : list
+            The steps of the profile, dicts with ``turn_on`` and ``turn_off`` lists of relay labels and ``hold``
+            seconds.
+
+        Raises
+        ------
+        ValueError:
+            When a step has an unknown key or relay, or a negative hold.
+        """
+
+        self.name = name
+        self.steps = []
+        offset = 0.0
+        for _ in range(repeat):
+            for step in steps:
+                on, off = tuple(step.get('turn_on', ())), tuple(step.get('turn_off', ()))
+                unknown = (set(step) - STEP_KEYS) | (set(on + off) - set(PiRelay.Relay.relaypins))
+                if unknown or step.get('hold', 0) < 0:
+                    raise ValueError(f'motion {name}: invalid step {step}')
+                self.steps.append((offset, on, off))
+                offset += step.get('hold', 0)
+        self.duration = offset
+
+    def run(self, relays, interrupted):
+        """Run the motion on a relay bank, from now.
+
+        Every step is written at its offset from the start of the motion on the monotonic clock, so waits do
+        not add up to drift, and the motion is preempted as soon as ``interrupted`` says so.
+
+        Parameters
+        ----------
+        relays : PiRelay.RelayBank
+            The relays to switch.
+
+        interrupted : callable
+            Called with a timeout in seconds, waits for it and returns True if the motion must stop earlier.
+
+        Returns
+        -------
+        lateness : list
+            Seconds each step that ran was written after its time in the plan.
+
+        completed : bool
+            False if the motion was preempted.
+        """
+
+        start = time.monotonic()
+        lateness = []
+        for offset, on, off in self.steps:
+            if interrupted(max(0.0, start + offset - time.monotonic())):
+                return lateness, False
+            lateness.append(time.monotonic() - start - offset)
+            relays.set(on, off)
+        return lateness, not interrupted(max(0.0, start + self.duration - time.monotonic()))
+
+    async def run_async(self, relays, lateness=None):
+        """Run the motion on a relay bank, from now, in the event loop.
+
+        As ``run``, but preempted by cancelling the task running it.
+
+        Parameters
+        ----------
+        relays : PiRelay.RelayBank
+            The relays to switch.
+
+        lateness : list
+            Seconds each step that ran was written after its time in the plan are appended to it, also when
+            the motion is preempted.
+
+        Returns
+        -------
+        lateness : list
+            lateness, a new list if None.
+        """
+
+        loop = asyncio.get_running_loop()
+        lateness = [] if lateness is None else lateness
+        start = loop.time()
+        for offset, on, off in self.steps:
+            await asyncio.sleep(max(0.0, start + offset - loop.time()))
+            lateness.append(loop.time() - start - offset)
+            relays.set(on, off)
+        await asyncio.sleep(max(0.0, start + self.duration - loop.time()))
+        return lateness
+
+
+def load_motions(configs):
+    """Compile the motion profiles of config.yml, ``DEFAULT_MOTIONS`` if there are none.
+
+    Returns
+    -------
+    motions : dict{ str:MotionPlan }
+        The plan of every motion by command name. ``main.cmd_handler`` runs it for the command of that name
+        in command mode, and for ``hey_chair_<name>`` at once.
+    """
+
+    profiles = configs.get('motions') or DEFAULT_MOTIONS
+    for name in profiles:
+        if name in ('none', 'stop', 'hey_chair'):
+            raise ValueError(f'{name} is a reserved command name, not a motion name')
+    motions = {name: MotionPlan(name, profile['steps'], profile.get('repeat', 1))
+               for name, profile in profiles.items()}
+    logger.debug(f'motions: { {name: plan.duration for name, plan in motions.items()} }')
+    return motions
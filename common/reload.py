@@ -0,0 +1,89 @@
+import importlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TableWatcher:
+    """Reloads the command table when the file of its module changes.
+
+    The modification time of the module file is polled by a daemon thread, which costs one ``os.stat`` per
+    ``interval`` and needs no file notification package. On a change the table and its grammar are rebuilt
+    from a fresh copy of the module and passed to every callback, from the watcher thread. The imported module
+    is left alone, its classes may be in use (``common.cmd_lookup`` holds both the default table and
+    ``CommandMatcher``).
+
+    Attributes
+    ----------
+    package : str
+        The module holding the table, ``cmd_table.package`` of config.yml.
+
+    table_name, build_dict : str
+        The names of the table and of its grammar builder in the module.
+
+    callbacks : list
+        Called with ``(cmd_table, d)`` after every reload.
+    """
+
+    def __init__(self, package, table_name, build_dict, callbacks=(), interval=1.0):
+        self.package = package
+        self.table_name = table_name
+        self.build_dict = build_dict
+        self.callbacks = list(callbacks)
+        self.interval = interval
+        self._module = importlib.import_module(package)
+        self._mtime = os.stat(self._module.__file__).st_mtime_ns
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='table-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                mtime = os.stat(self._module.__file__).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.reload()
+
+    def reload(self):
+        """Reload the table now.
+
+        Returns
+        -------
+        cmd_table : dict{ str:str }
+            The new table, None if the module failed to reload; the old table is kept then.
+
+        d : str
+            The grammar built from the new table, None if the module failed to reload.
+        """
+
+        s = time.perf_counter()
+        try:
+            spec = importlib.util.spec_from_file_location(self.package, self._module.__file__)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            cmd_table = getattr(module, self.table_name)
+            d = getattr(module, self.build_dict)(cmd_table)
+        except Exception as e:
+            logger.error(f'reloading {self.package} failed, keeping the old table: {e!r}')
+            return None, None
+        for callback in self.callbacks:
+            callback(cmd_table, d)
+        logger.info(f'reloaded {self.package}.{self.table_name}: {len(cmd_table)} phrases in '
+                    f'{(time.perf_counter() - s) * 1e3:.1f}ms')
+        return cmd_table, d
@@ -0,0 +1,151 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def frame_energy_db(x, frame_length, hop_length):
+    """Energy of every analysis frame, in dB relative to full scale.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        int16 samples, or floats in [-1, 1].
+
+    frame_length : int
+        Length of analysis frame (in samples).
+
+    hop_length : int
+        Samples between the starts of consecutive frames.
+
+    Returns
+    -------
+    energy : np.ndarray
+        The RMS of each whole frame in dBFS, float32, one per frame.
+    """
+
+    if len(x) < frame_length:
+        return np.empty(0, np.float32)
+    scale = 2 ** 15 if x.dtype == np.int16 else 1
+    if frame_length % hop_length == 0:
+        # Frames made of whole hops: the energy of every hop once, then sums of k consecutive hops, so every
+        # sample is squared once however much the frames overlap.
+        k = frame_length // hop_length
+        n = (len(x) - frame_length) // hop_length + 1
+        # The hops are squared in float32, half the memory traffic of float64; the running sum is float64 so
+        # that the differences of its far apart terms keep their precision.
+        hops = x[:(n + k - 1) * hop_length].reshape(-1, hop_length).astype(np.float32, copy=False)
+        energy = np.einsum('ij,ij->i', hops, hops)
+        if k > 1:
+            total = np.concatenate(([0.0], np.cumsum(energy, dtype=np.float64)))
+            energy = total[k:] - total[:-k]
+    else:
+        # A strided view, the frames are not copied.
+        frames = np.lib.stride_tricks.sliding_window_view(x, frame_length)[::hop_length]
+        energy = np.einsum('ij,ij->i', frames, frames, dtype=np.float64)
+    power = np.maximum(energy, 0) / (frame_length * scale * scale)
+    return (10 * np.log10(power + 1e-10)).astype(np.float32)
+
+
+class EnergyVAD:
+    """Energy based voice activity gate in front of the recognizer.
+
+    Audio blocks pass only while one of their 10 ms frames is ``margin_db`` louder than the noise floor
+    (and louder than ``min_db``), and for ``hangover`` seconds after, so that the recognizer sees the end of
+    the utterance and can finalize it. The last ``preroll`` seconds of gated audio are passed on at the onset
+    of speech, so that the start of the first word is not clipped. The noise floor follows the quietest
+    frame of the gated blocks: it drops at once and rises by ``floor_rise_db`` per second. While the gate is
+    open it follows the quietest frame of the last ``floor_window`` seconds instead, which the pauses between
+    words keep near the noise; so when the background noise rises by more than ``margin_db`` (a fan, a TV),
+    the floor catches up and the gate closes instead of staying open for good.
+
+    Attributes
+    ----------
+    active : bool
+        Whether blocks are passed to the recognizer.
+
+    noise_floor : float
+        The estimated noise level, in dBFS.
+
+    passed, gated : int
+        Samples passed to the recognizer, and held back.
+    """
+
+    def __init__(self, sample_rate, margin_db=10.0, min_db=-50.0, preroll=0.3, hangover=0.8, floor_rise_db=3.0,
+                 floor_window=3.0):
+        self.sample_rate = sample_rate
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.frame_length = sample_rate // 100
+        self.preroll = int(preroll * sample_rate)
+        self.hangover = int(hangover * sample_rate)
+        self.floor_rise_db = floor_rise_db
+        self.floor_window = int(floor_window * sample_rate)
+        self.active = False
+        self.noise_floor = None
+        self.passed = 0
+        self.gated = 0
+        self._silent = 0
+        self._preroll = deque()
+        self._preroll_len = 0
+        # (samples, quietest frame) of the blocks of the last floor_window seconds.
+        self._quietest = deque()
+        self._quietest_len = 0
+
+    def filter(self, data):
+        """Gate one block of audio.
+
+        Parameters
+        ----------
+        data : bytes
+            int16 audio data.
+
+        Returns
+        -------
+        data : bytes
+            The audio to pass to the recognizer: empty while there is no speech, the pre-roll and the block at
+            the onset of speech, else the block.
+        """
+
+        x = np.frombuffer(data, np.int16)
+        energy = frame_energy_db(x, self.frame_length, self.frame_length)
+        loudest = energy.max() if len(energy) else -100.0
+        if self.noise_floor is None:
+            self.noise_floor = loudest
+        speech = loudest > max(self.noise_floor + self.margin_db, self.min_db)
+        quietest = energy.min() if len(energy) else self.noise_floor
+        self._quietest.append((len(x), quietest))
+        self._quietest_len += len(x)
+        while self._quietest_len - self._quietest[0][0] >= self.floor_window:
+            self._quietest_len -= self._quietest.popleft()[0]
+        if speech:
+            # Minimum statistics: speech has pauses, a window without any is louder background noise.
+            quietest = min(q for _, q in self._quietest)
+        rise = self.floor_rise_db * len(x) / self.sample_rate
+        self.noise_floor = min(quietest, self.noise_floor + rise)
+
+        if speech:
+            self._silent = 0
+            if not self.active:
+                self.active = True
+                logger.debug('speech onset, noise floor %.1fdB', self.noise_floor)
+                data = b''.join(self._preroll) + data
+                self.gated -= self._preroll_len
+                self._preroll.clear()
+                self._preroll_len = 0
+        elif self.active:
+            self._silent += len(x)
+            if self._silent > self.hangover:
+                self.active = False
+
+        if self.active:
+            self.passed += len(data) // 2
+            return data
+        self.gated += len(x)
+        self._preroll.append(data)
+        self._preroll_len += len(x)
+        while self._preroll_len - len(self._preroll[0]) // 2 >= self.preroll:
+            self._preroll_len -= len(self._preroll.popleft()) // 2
+        return b''
@@ -0,0 +1,453 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from common import metrics
+from common.audio import MicrophoneSource
+
+logger = logging.getLogger(__name__)
+
+# The same histogram as the in-process RecognitionSession callback.
+AUDIO_CALLBACK = metrics.histogram('voice_audio_callback_seconds', 'Time in the audio callback, per block')
+
+# Slots of the int64 header of SharedAudioRing.
+WRITTEN, READ, DROPPED, OVERFLOWS, CLOSED, WRITING = range(6)
+HEADER_BYTES = 64
+
+# Held for good, see _fence.
+_FENCE_LOCK = threading.Lock()
+_FENCE_LOCK.acquire()
+
+
+def _fence():
+    # A memory barrier, which Python has no direct means for. The one assumption the ordering of
+    # SharedAudioRing rests on: releasing and acquiring a lock is a full barrier on every supported platform.
+    _FENCE_LOCK.release()
+    _FENCE_LOCK.acquire()
+
+
+class SharedAudioRing:
+    """Ring buffer of int16 audio in shared memory, from one writer process to one reader process.
+
+    The writer never waits, like the writer of a seqlock: it first publishes the count of samples written
+    once the samples are in (``WRITING``), copies them in, and then publishes the new count of samples
+    written (``WRITTEN``). The reader copies samples out below ``WRITTEN`` and then checks ``WRITING``; when
+    the writer went, or was going, round the ring past them, the copy may be torn, and the overwritten
+    (oldest) audio is dropped and counted, as the ``drop_oldest`` policy of ``AudioQueue``. The counts are
+    stored with ``_publish`` and loaded with ``_acquire``, whose ordering assumes only that a lock
+    release/acquire is a full memory barrier. No lock is shared between the processes, so a slow or stopped
+    reader cannot delay the audio callback.
+
+    The ring is pickled by name: a copy passed to another process attaches to the same shared memory.
+
+    Attributes
+    ----------
+    capacity : int
+        The number of samples the ring holds.
+
+    name : str
+        The name of the shared memory block.
+    """
+
+    def __init__(self, capacity, name=None):
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=HEADER_BYTES + capacity * 2)
+        self.name = self._shm.name
+        self._header = np.ndarray(6, np.int64, self._shm.buf)
+        self._time = np.ndarray(1, np.float64, self._shm.buf, offset=48)
+        self._data = np.ndarray(capacity, np.int16, self._shm.buf, offset=HEADER_BYTES)
+        if name is None:
+            self._header[:] = 0
+        self._read = int(self._header[READ])
+
+    def __reduce__(self):
+        return self.__class__, (self.capacity, self.name)
+
+    def _load(self, slot):
+        # Read until stable, an int64 store may not be atomic on a 32-bit Pi.
+        value = int(self._header[slot])
+        while True:
+            again = int(self._header[slot])
+            if again == value:
+                return value
+            value = again
+
+    def _publish(self, slot, value):
+        # Stores of this process before are visible to the other one before the value, and the value before
+        # stores after, see _fence.
+        _fence()
+        self._header[slot] = value
+        _fence()
+
+    def _acquire(self, slot):
+        # The counterpart of _publish: loads after see the stores published with the value, see _fence.
+        _fence()
+        value = self._load(slot)
+        _fence()
+        return value
+
+    def write(self, samples, overflowed=False):
+        """Copy samples into the ring, from the writer process.
+
+        Parameters
+        ----------
+        samples : np.ndarray
+            int16 samples, at most ``capacity``.
+
+        overflowed : bool
+            Whether the audio callback was flagged with an input overflow, counted in ``stats()``.
+        """
+
+        w = int(self._header[WRITTEN])
+        self._publish(WRITING, w + len(samples))
+        pos = w % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self._data[pos:pos + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self._time[0] = time.monotonic()
+        if overflowed:
+            self._header[OVERFLOWS] += 1
+        self._publish(WRITTEN, w + len(samples))
+
+    def read_into(self, out):
+        """Copy the next len(out) samples into out, from the reader process.
+
+        Returns
+        -------
+        read : bool
+            False if fewer than len(out) samples are available; nothing is read then.
+        """
+
+        n = len(out)
+        r = self._read
+        while True:
+            w = self._acquire(WRITTEN)
+            if w - r > self.capacity:
+                r = self._drop(r, w)
+            if w - r < n:
+                self._read = r
+                return False
+            pos = r % self.capacity
+            first = min(n, self.capacity - pos)
+            out[:first] = self._data[pos:pos + first]
+            out[first:] = self._data[:n - first]
+            # The copy is only valid if the writer did not start overwriting it meanwhile.
+            writing = self._acquire(WRITING)
+            if writing - r <= self.capacity:
+                break
+            r = self._drop(r, writing)
+        self._read = r + n
+        self._header[READ] = self._read
+        return True
+
+    def _drop(self, r, w):
+        self._header[DROPPED] += w - self.capacity - r
+        return w - self.capacity
+
+    def close_writer(self):
+        """Tell the reader that no more audio will be written."""
+
+        self._header[CLOSED] = 1
+
+    @property
+    def writer_closed(self):
+        return bool(self._header[CLOSED])
+
+    def stats(self):
+        """The counters of the ring, as a dict, like ``AudioQueue.stats``."""
+
+        written = self._load(WRITTEN)
+        return {
+            'depth': min(written - self._load(READ), self.capacity),
+            'written': written,
+            'dropped': self._load(DROPPED),
+            'input_overflows': self._load(OVERFLOWS),
+            'since_last_write': time.monotonic() - self._time[0] if written else None,
+        }
+
+    def close(self):
+        """Detach this process from the shared memory."""
+
+        self._header = self._time = self._data = None
+        self._shm.close()
+
+    def unlink(self):
+        """Free the shared memory, from the process that created the ring."""
+
+        self._shm.unlink()
+
+
+class RingSource:
+    """Audio from a SharedAudioRing, as an audio source of ``RecognitionSession`` in the decoder process.
+
+    A thread polls the ring every ``poll_interval`` seconds and passes every ``blocksize`` samples to the
+    callback, like a sounddevice callback. The source is finished when the writer is closed and the ring
+    is drained.
+    """
+
+    def __init__(self, ring, blocksize, poll_interval=0.005):
+        self.ring = ring
+        self.blocksize = blocksize
+        self.poll_interval = poll_interval
+        self.finished = False
+        self._running = False
+        self._thread = None
+
+    def start(self, callback=None):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(callback,), name='ring-source', daemon=True)
+        self._thread.start()
+
+    def _run(self, callback):
+        block = np.empty(self.blocksize, np.int16)
+        while self._running:
+            if self.ring.read_into(block):
+                callback(block.data, len(block), None, None)
+            elif self.ring.writer_closed:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        self.finished = True
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+
+def set_realtime_priority(priority):
+    """Run the calling thread, and the threads it creates from now, with the SCHED_FIFO priority.
+
+    Not ``SCHED_RESET_ON_FORK``: Linux applies it to every clone, threads included, so no thread would inherit
+    the priority; the decoder process resets itself to the normal policy instead. Needs root or CAP_SYS_NICE;
+    without, a warning is logged and nothing changes.
+
+    Returns
+    -------
+    done : bool
+        Whether the priority was set.
+    """
+
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, PermissionError, OSError) as e:
+        logger.warning(f'cannot set real-time priority {priority}: {e!r}')
+        return False
+    logger.info(f'real-time priority {priority}')
+    return True
+
+
+class IsolatedSession:
+    """The capture side of a RecognitionSession run by a DecoderProcess.
+
+    Has the interface of ``RecognitionSession`` used by ``main.main_loop``: the audio callback only copies the
+    block into the shared ring, and ``commands()`` yields the commands the decoder process sends back.
+
+    Attributes
+    ----------
+    queue : SharedAudioRing
+        The ring between the audio callback and the decoder process, its ``stats()`` tell about drops.
+
+    source : MicrophoneSource, WavSource
+        The audio source, a MicrophoneSource created in ``open()`` unless another one is given.
+    """
+
+    def __init__(self, decoder, index, ring, conn, sample_rate, blocksize, device=None, source=None):
+        self.decoder = decoder
+        self.index = index
+        self.queue = ring
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.device = device
+        self.source = source
+        self._conn = conn
+        self._closed = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _callback(self, in_data, frames, time_info, status):
+        s = time.perf_counter()
+        self.queue.write(np.frombuffer(in_data, np.int16), bool(status))
+        AUDIO_CALLBACK.observe(time.perf_counter() - s)
+
+    def open(self):
+        """Start the audio stream into the ring."""
+
+        self._closed = False
+        if self.source is None:
+            self.source = MicrophoneSource(sample_rate=self.sample_rate, blocksize=self.blocksize,
+                                           device=self.device)
+        self.source.start(callback=self._callback)
+
+    def close(self):
+        """Stop the audio source, ``commands()`` returns once the decoder is done with the audio."""
+
+        self._closed = True
+        if self.source is not None:
+            self.source.stop()
+        self.queue.close_writer()
+
+    def set_table(self, cmd_table, d):
+        """Replace the command table and the grammar in the decoder process, see ``RecognitionSession``."""
+
+        self.decoder.send(('table', self.index, cmd_table, d))
+
+    def commands(self):
+        """The commands recognized by the decoder process.
+
+        Yields
+        ------
+        cmd : str
+            The mapped command of each recognized utterance, until the decoder finished the audio.
+        """
+
+        while True:
+            try:
+                if not self._conn.poll(0.5):
+                    if not self.decoder.process.is_alive():
+                        logger.error(f'decoder process exited with {self.decoder.process.exitcode}')
+                        return
+                    if self.source.finished:
+                        # A replayed source ran out of audio, the decoder finishes the ring and says so.
+                        self.queue.close_writer()
+                    continue
+                cmd = self._conn.recv()
+            except EOFError:
+                logger.error('decoder process exited')
+                return
+            if cmd is None:
+                return
+            yield cmd
+
+
+def _forward(session, conn):
+    try:
+        for cmd in session.commands():
+            conn.send(cmd)
+        conn.send(None)
+    except (BrokenPipeError, EOFError):
+        session.close()
+
+
+def _decoder_main(factory, model, rings, conns, control, blocksize, log_level, log_format):
+    # Ctrl+C reaches the whole process group, the capture process stops the decoder.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=log_level, format=log_format)
+    # Decoding must not compete with the audio callback, should the process be started at real-time priority.
+    if hasattr(os, 'sched_setscheduler'):
+        os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+    if isinstance(model, str):
+        from vosk_microphone_pi import load_model
+        model = load_model(model)
+    sessions = [factory(model=model, source=RingSource(ring, blocksize)) for ring in rings]
+    threads = []
+    for session, conn in zip(sessions, conns):
+        session.open()
+        thread = threading.Thread(target=_forward, args=(session, conn), daemon=True)
+        thread.start()
+        threads.append(thread)
+    try:
+        while True:
+            msg = control.recv()
+            if msg[0] == 'table':
+                sessions[msg[1]].set_table(*msg[2:])
+            elif msg[0] == 'stop':
+                break
+    except EOFError:
+        # The capture process is gone.
+        pass
+    finally:
+        for session in sessions:
+            session.close()
+        for thread in threads:
+            thread.join(timeout=2.0)
+
+
+class DecoderProcess:
+    """Recognition sessions run in a worker process, away from the audio capture and the relays.
+
+    Audio goes from the audio callbacks of this process to the worker through one SharedAudioRing per
+    session, and the recognized commands come back through one pipe per session; the pipes only carry the
+    command names. A long ``AcceptWaveform``, the gate (librosa/numpy in the dtw mode) or a GC pause of the
+    decoder no longer holds the GIL of the process running the audio callbacks and the motion timing. The
+    worker is started with ``spawn``, so it does not inherit the threads, the GPIO state or the real-time
+    priority of this process. The metrics of the decoder stages stay in the worker.
+
+    Attributes
+    ----------
+    sessions : list
+        The IsolatedSession of every input, to open in this process.
+
+    process : multiprocessing.Process
+        The worker, started by ``start``.
+    """
+
+    def __init__(self, factory, model, devices, sample_rate, blocksize, ring_seconds=2.0, log_level=logging.INFO,
+                 log_format=None):
+        """Constructor of class DecoderProcess.
+
+        Parameters
+        ----------
+        factory : callable
+            Called in the worker with ``model`` and ``source`` keywords to build each RecognitionSession,
+            e.g. ``functools.partial(main.build_session, configs, mode)``. Must be picklable.
+
+        model : str
+            The path of the vosk model, loaded once in the worker for all the sessions.
+
+        devices : list
+            The input device of every session, see ``common.audio.input_device``.
+
+        ring_seconds : float
+            Seconds of audio each ring holds before the oldest is dropped.
+
+        log_level, log_format :
+            The logging of the worker, as ``logging.basicConfig``.
+        """
+
+        ctx = multiprocessing.get_context('spawn')
+        rings = [SharedAudioRing(int(ring_seconds * sample_rate)) for _ in devices]
+        pipes = [ctx.Pipe(duplex=False) for _ in devices]
+        control_recv, self._control = ctx.Pipe(duplex=False)
+        self._lock = threading.Lock()
+        self.sessions = [IsolatedSession(self, i, ring, recv, sample_rate, blocksize, device)
+                         for i, (ring, (recv, _), device) in enumerate(zip(rings, pipes, devices))]
+        self.process = ctx.Process(target=_decoder_main, name='decoder', daemon=True,
+                                   args=(factory, model, rings, [send for _, send in pipes], control_recv, blocksize,
+                                         log_level, log_format))
+
+    def start(self):
+        self.process.start()
+
+    def send(self, msg):
+        with self._lock:
+            self._control.send(msg)
+
+    def stop(self, timeout=5.0):
+        """Stop the worker and free the rings."""
+
+        if self.process.is_alive():
+            try:
+                self.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                logger.warning('decoder process did not stop, terminating it')
+                self.process.terminate()
+                self.process.join()
+        for session in self.sessions:
+            session.queue.close()
+            session.queue.unlink()
@@ -0,0 +1,16 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_config(path: str = './config/config.yml'):
+    import yaml
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = yaml.load(f, Loader=yaml.FullLoader)
+        # print(config)
+    except FileNotFoundError as e:
+        logger.error(f'config file not exists: {path}')
+        raise e
+    else:
+        return config
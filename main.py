@@ -1,65 +1,78 @@
+import asyncio
+import functools
 import logging
-import utils
+import signal
 from importlib import import_module
-import vosk
-from vosk_microphone_pi import action_listen, load_model
+from config import load_config
 import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from threading import Condition
 import PiRelay
+from common import metrics
+from common.motion import load_motions
 
 FORMAT = '%(asctime)-15s %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=FORMAT)
 logger = logging.getLogger(__name__)
 
+DISPATCH = metrics.histogram('handler_dispatch_seconds', 'Time of cmd_handler.execute, per command')
+STEP_LATENESS = metrics.histogram('motion_step_lateness_seconds', 'Delay of the relay steps behind the motion plan')
+
+# Commands made of it and a motion name run the motion without entering command mode first.
+WAKE_PREFIX = 'hey_chair_'
+
+# Chunk size of audio stream data for vosk recognizer, blocks are 10 chunks unless vosk.blocksize is set.
+VOSK_CHUNK = 20
+
+
 def cmd_handler_task(cmd_hnd):
-    relay1 = PiRelay.Relay("RELAY1")
-    relay2 = PiRelay.Relay("RELAY2")
-    relay3 = PiRelay.Relay("RELAY3")
-    relay4 = PiRelay.Relay("RELAY4")
-
-    while (cmd_hnd.running):
-        relay1.off()
-        relay2.off()
-        relay3.off()
-        relay4.off()
-
-        if (cmd_hnd.cmd_name == "recliner_down"):
-            for _ in range(1, 10):
-                if (cmd_hnd.cmd_name == "recliner_down"):
-                    logger.debug("down down down")
-                    relay3.on()
-                    relay4.on()
-                    time.sleep(0.2)
-                    relay1.on()
-                    time.sleep(1)
-            if (cmd_hnd.cmd_name == "recliner_down"):
-                cmd_hnd.cmd_name = "none"
-            # Continue from the start of the loop
-            continue
-
-        if (cmd_hnd.cmd_name == "recliner_up"):
-            for _ in range(1, 10):
-                if (cmd_hnd.cmd_name == "recliner_up"):
-                    logger.debug("up up up")
-                    relay3.on()
-                    relay4.on()
-                    time.sleep(0.2)
-                    relay2.on()
-                    time.sleep(1)
-            if (cmd_hnd.cmd_name == "recliner_up"):
-                cmd_hnd.cmd_name = "none"
-            # Continue from the start of the loop
-            continue
-        #with (cmd_hnd.cv):
-        #    cmd_hnd.cv.wait()
-        #    print("running " + cmd_hnd.cmd_name)
-        time.sleep(1)
+    # Only the relays that change state are written, each transition in one GPIO call.
+    relays = PiRelay.RelayBank(cmd_hnd.relay_pins)
+
+    while True:
+        with cmd_hnd.cv:
+            # Sleep until execute() or shutdown() selects something to do.
+            cmd_hnd.cv.wait_for(lambda: not cmd_hnd.running or cmd_hnd.cmd_name in cmd_hnd.motions)
+            if not cmd_hnd.running:
+                break
+            cmd = cmd_hnd.cmd_name
+
+        logger.debug(f"running {cmd}")
+        lateness, completed = cmd_hnd.motions[cmd].run(relays, lambda timeout: cmd_hnd.interrupted(cmd, timeout))
+        cmd_hnd.lateness.extend(lateness)
+        for late in lateness:
+            STEP_LATENESS.observe(late)
+        if completed:
+            with cmd_hnd.cv:
+                if cmd_hnd.cmd_name == cmd:
+                    cmd_hnd.cmd_name = "none"
+        relays.all_off()
+
+    relays.all_off()
+
 
 class cmd_handler:
 
-    def __init__(self):
+    def __init__(self, relay_pins=None, motions=None):
+        """Start the thread driving the relays.
+
+        Parameters
+        ----------
+        relay_pins : dict{ str:int }
+            Board pin of each relay ("RELAY1".."RELAY4") of the chair, ``PiRelay.Relay.relaypins`` for the
+            ones not given.
+
+        motions : dict{ str:MotionPlan }
+            The motion run for each command name, see ``common.motion.load_motions``. The default motions if
+            None.
+        """
+
+        self.relay_pins = relay_pins or {}
+        self.motions = motions or load_motions({})
+        # Seconds the last relay steps were written after their time in the motion plan.
+        self.lateness = deque(maxlen=1000)
         self.command_mode = False
         self.cv = Condition()
         self.running = True
@@ -67,21 +80,39 @@ class cmd_handler:
         self.cmd_name = "none"
         self.thrd.start()
 
+    def _set_cmd(self, cmd_name):
+        with self.cv:
+            self.cmd_name = cmd_name
+            self.cv.notify()
+
+    def interrupted(self, cmd_name, timeout):
+        """Wait up to timeout seconds for cmd_name to be replaced.
+
+        Returns True as soon as another command is set or the handler is shut down.
+        """
+
+        with self.cv:
+            return self.cv.wait_for(lambda: not self.running or self.cmd_name != cmd_name, timeout)
+
+    def shutdown(self):
+        """Stop the handler thread, turning all relays off."""
+
+        with self.cv:
+            self.running = False
+            self.cv.notify()
+        self.thrd.join()
+
     def execute(self, cmd):
         if (cmd == "stop"):
             self.command_mode = False
             logger.debug("Stopping")
-            self.cmd_name = "stop"
-            return
-
-        if (cmd == "hey_chair_recliner_up"):
-            logger.debug("Entering command mode - Recliner up")
-            self.cmd_name = "recliner_up"
+            self._set_cmd("stop")
             return
 
-        if (cmd == "hey_chair_recliner_down"):
-            logger.debug("Entering command mode - Recliner down")
-            self.cmd_name = "recliner_down"
+        # "hey_chair_<motion>" runs any motion of config.yml at once.
+        if (cmd.startswith(WAKE_PREFIX) and cmd[len(WAKE_PREFIX):] in self.motions):
+            logger.debug(f"Entering command mode - {cmd[len(WAKE_PREFIX):]}")
+            self._set_cmd(cmd[len(WAKE_PREFIX):])
             return
 
         if (cmd == "hey_chair"):
@@ -97,95 +128,405 @@ class cmd_handler:
         if (now - self.command_mode_start_time > 10):
             logger.debug("Command mode time has expired")
             self.command_mode = False
-            self.cmd_name = "none"
+            self._set_cmd("none")
             return
 
-        if (cmd == "recliner_up"):
-            logger.debug("Recliner raising")
+        # "<motion>" runs it in command mode, after "hey_chair".
+        if (cmd in self.motions):
+            logger.debug(f"Running {cmd}")
             self.command_mode = False
-            self.cmd_name = cmd
-            #self.cv.notify()
+            self._set_cmd(cmd)
             return
 
-        if (cmd == "recliner_down"):
-            logger.debug("Recliner lowering")
-            self.command_mode = False
-            self.cmd_name = cmd
-            #self.cv.notify()
-            return
 
-def load_config(path: str = './config/config.yml'):
-    import yaml
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-        # print(config)
-    except FileNotFoundError as e:
-        logger.error(f'config file not exists: {path}')
-        raise e
-    else:
-        return config
+class async_cmd_handler(cmd_handler):
+    """cmd_handler running the motions as tasks of the event loop, instead of in a thread.
 
-def task_action(cmd_handler, model, sample_rate, cmd_table, d, chunk):
+    ``execute`` is the same and must be called from the event loop: a new command cancels the task of the
+    running motion, which switches all the relays off, before the task of the next motion starts.
+    """
+
+    def __init__(self, relay_pins=None, motions=None):
+        self.relay_pins = relay_pins or {}
+        self.motions = motions or load_motions({})
+        self.lateness = deque(maxlen=1000)
+        self.command_mode = False
+        self.cmd_name = "none"
+        self.relays = PiRelay.RelayBank(self.relay_pins)
+        self._task = None
+
+    def _set_cmd(self, cmd_name):
+        self.cmd_name = cmd_name
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if cmd_name in self.motions:
+            self._task = asyncio.get_running_loop().create_task(self._run(cmd_name))
+
+    async def _run(self, cmd):
+        logger.debug(f"running {cmd}")
+        lateness = []
+        try:
+            await self.motions[cmd].run_async(self.relays, lateness)
+            if self.cmd_name == cmd:
+                self.cmd_name = "none"
+        finally:
+            self.lateness.extend(lateness)
+            for late in lateness:
+                STEP_LATENESS.observe(late)
+            self.relays.all_off()
+
+    def shutdown(self):
+        """Cancel the running motion and turn all relays off."""
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.relays.all_off()
+
+
+def task_action(cmd_handler, session):
     """The function for receiving, recognizing and executing the voice commands.
 
     Parameters
     ----------
-    ser : serial.Serial
-        The serial port of Petoi.
+    cmd_handler : cmd_handler
+        The handler that executes the recognized commands.
 
-    model : vosk.Model
-        The loaded vosk model for speech recognition.
+    session : RecognitionSession
+        The opened recognition session that yields the recognized commands.
+    """
 
-    sample_rate : int
-        The sample rate when receiving audio data.
+    logger.info("Start act")
+    for cmd in session.commands():
+        s = time.perf_counter()
+        cmd_handler.execute(cmd)
+        DISPATCH.observe(time.perf_counter() - s)
 
-    cmd_table : dict{ str:str }
-        Key represents the result of speech recognition(voice command).
-        Value represents the corresponding Petoi command.
 
-    d : str
-        A customized dictionary indicating the range of words to be recognized.
+async def async_task_action(session, commands):
+    """Pass the commands of an AsyncRecognitionSession to the queue of an actuator.
 
-    chunk : int
-        The chunk size of the audio stream data.
+    Parameters
+    ----------
+    session : AsyncRecognitionSession
+        The opened session.
+
+    commands : asyncio.Queue
+        The commands of the chair, other coroutines (timers, network control) can put commands in it too.
     """
 
-    logger.info("Start act")
-    action_listen(cmd_handler=cmd_handler, model=model, sample_rate=sample_rate, cmd_table=cmd_table, d=d, chunk=chunk)
+    async for cmd in session.commands():
+        await commands.put(cmd)
 
 
-def main_loop(cmd_handler, mode=0):
-    """The loop for waking up Petoi and sending voice commands.
+async def actuate(cmd_handler, commands):
+    """Execute the commands of the queue of a chair, forever.
+
+    Parameters
+    ----------
+    cmd_handler : async_cmd_handler
+        The handler of the chair.
+
+    commands : asyncio.Queue
+        The commands to execute.
+    """
+
+    while True:
+        cmd = await commands.get()
+        s = time.perf_counter()
+        cmd_handler.execute(cmd)
+        DISPATCH.observe(time.perf_counter() - s)
+
+
+def build_gate(configs, mode, sample_rate):
+    """Build the first stage in front of the vosk recognizer.
+
+    Parameters
+    ----------
+    configs : dict
+        The loaded config.yml.
+
+    mode : str
+        'vosk' to decode all the audio, 'vad' to decode only the audio around speech, 'dtw' to decode only a
+        window of audio around the wake-up word found by the Listener template.
+
+    sample_rate : int
+        The sample rate of the audio stream.
+
+    Returns
+    -------
+    gate : common.vad.EnergyVAD, utils.WakeWordGate
+        None in 'vosk' mode.
+    """
+
+    if mode == 'vosk':
+        return None
+    if mode == 'vad':
+        from common.vad import EnergyVAD
+        vad_configs = configs.get('vad', {})
+        return EnergyVAD(sample_rate, margin_db=vad_configs.get('margin_db', 10.0),
+                         min_db=vad_configs.get('min_db', -50.0), preroll=vad_configs.get('preroll', 0.3),
+                         hangover=vad_configs.get('hangover', 0.8), floor_window=vad_configs.get('floor_window', 3.0))
+    if mode == 'dtw':
+        from utils import FeatureCache, Voice, WakeWordGate
+        listener_configs = configs['Listener']
+        if not listener_configs.get('template') or not listener_configs.get('thresh'):
+            raise ValueError('dtw mode needs a Listener template and thresh in config.yml')
+        template = Voice(listener_configs['template'], cache=FeatureCache.for_recordings(configs['recording_path']))
+        cascade = configs.get('cascade', {})
+        return WakeWordGate(template, listener_configs['thresh'], rate=sample_rate,
+                            preroll=cascade.get('preroll', 1.5), window=cascade.get('window', 4.0))
+    raise ValueError(f'unknown mode: {mode}')
+
+
+def build_session(configs, mode=None, model=None, device=None, source=None):
+    """Build the recognition session described by configs.
+
+    Only the modules of the vosk backend are imported, and the vosk model starts loading in the background
+    so that it overlaps with opening the audio stream in ``RecognitionSession.open``.
 
     Parameters
     ----------
-    mode : int
-        0 if you want to begin with wakeup recognition.
-        1 if you want to begin with command recognition.
+    configs : dict
+        The loaded config.yml.
+
+    mode : str
+        The first stage in front of the recognizer (see ``build_gate``), the ``mode`` of config.yml by default.
+
+    model : vosk.Model, concurrent.futures.Future
+        The model to share with other sessions, as returned by ``load_model_async``. Loaded from the
+        ``vosk_model_path`` of config.yml if None.
+
+    device : int, str
+        The input device, the default input device if None.
+
+    source : common.worker.RingSource, common.audio.WavSource
+        The audio source, a MicrophoneSource on device if None.
+
+    Returns
+    -------
+    session : RecognitionSession
+        The session, not opened yet.
     """
 
+    from vosk_microphone_pi import RecognitionSession, load_model_async
+
     table_pkg = import_module(configs['cmd_table']['package'])
     cmd_table = getattr(table_pkg, configs['cmd_table']['table_name'])
     build_dict = getattr(table_pkg, configs['cmd_table']['build_dict'])
 
-    # Chunk size of audio stream data for vosk recognizer.
-    vosk_chunk = 20
+    vosk_configs = configs.get('vosk', {})
     # The rate of audio stream data for vosk recognizer.
-    sample_rate = 16000
+    sample_rate = vosk_configs.get('sample_rate', 16000)
 
     # Initialize vosk model for speech recognition.
+    if model is None:
+        model = load_model_async(model=configs['vosk_model_path'])
     d = build_dict(cmd_table)
-    model = load_model(model=configs['vosk_model_path'])
 
-    while True:
-        logger.debug(f'mode={mode}, action_listen')
-        task_action(cmd_handler=cmd_handler, model=model, sample_rate=sample_rate, cmd_table=cmd_table, d=d, chunk=vosk_chunk)
+    gate = build_gate(configs, mode or configs.get('mode', 'vosk'), sample_rate)
+
+    audio_queue = configs.get('audio_queue', {})
+    early_commit = vosk_configs.get('early_commit', {})
+    return RecognitionSession(model=model, sample_rate=sample_rate, cmd_table=cmd_table, d=d, chunk=VOSK_CHUNK,
+                              queue_seconds=audio_queue.get('max_seconds', 1.0),
+                              queue_policy=audio_queue.get('policy', 'drop_oldest'),
+                              blocksize=vosk_configs.get('blocksize'), accept_size=vosk_configs.get('accept_size'),
+                              early_commands=early_commit.get('commands', []) if early_commit.get('enabled') else (),
+                              stable_partials=early_commit.get('stable_partials', 3),
+                              min_confidence=vosk_configs.get('min_confidence', 0.0), gate=gate, device=device,
+                              source=source)
 
-configs = load_config('./config/config.yml')
 
-try:
-    main_loop(cmd_handler(), mode=1)
-except KeyboardInterrupt:
-    print('\nDone, exit')
-    exit(0)
+def start_services(configs, sessions):
+    """Start the metrics endpoint and dump, and the command table watcher, as set in config.yml.
+
+    Parameters
+    ----------
+    configs : dict
+        The loaded config.yml.
+
+    sessions : list
+        The sessions the reloaded command tables are passed to, with their ``set_table``.
+
+    Returns
+    -------
+    stop : callable
+        Stops all that was started.
+    """
+
+    metrics_configs = configs.get('metrics') or {}
+    server = metrics.serve(metrics_configs['http_port']) if metrics_configs.get('http_port') else None
+    dumper = None
+    if metrics_configs.get('json_path'):
+        dumper = metrics.JsonDumper(metrics_configs['json_path'], metrics_configs.get('json_interval', 10.0))
+        dumper.start()
+
+    watcher = None
+    table_configs = configs['cmd_table']
+    if table_configs.get('reload'):
+        from common.reload import TableWatcher
+        # Edits of the command table reach the sessions without restarting or reloading the model.
+        watcher = TableWatcher(table_configs['package'], table_configs['table_name'], table_configs['build_dict'],
+                               callbacks=[session.set_table for session in sessions],
+                               interval=table_configs.get('reload_interval', 1.0))
+        watcher.start()
+
+    def stop():
+        if watcher is not None:
+            watcher.stop()
+        if dumper is not None:
+            dumper.stop()
+        if server is not None:
+            server.shutdown()
+
+    return stop
+
+
+def main_loop(configs, mode=None):
+    """The loop for waking up Petoi and sending voice commands.
+
+    Every chair of config.yml gets its own recognition session, on its own input device, and its own
+    cmd_handler driving its own relays; the sessions share one vosk model and run in a thread pool. With
+    ``isolation.enabled`` in config.yml, the sessions run in a decoder process (see
+    ``common.worker.DecoderProcess``) and this process only captures the audio and drives the relays.
+
+    Parameters
+    ----------
+    configs : dict
+        The loaded config.yml.
+
+    mode : str
+        'vosk', 'vad' or 'dtw', see ``build_gate``. The ``mode`` of config.yml by default.
+    """
+
+    chairs = configs.get('chairs') or [{'name': 'chair'}]
+    isolation = configs.get('isolation') or {}
+    decoder = None
+    if isolation.get('enabled'):
+        from common.worker import DecoderProcess, set_realtime_priority
+        vosk_configs = configs.get('vosk', {})
+        decoder = DecoderProcess(functools.partial(build_session, configs, mode), configs['vosk_model_path'],
+                                 [chair.get('device') for chair in chairs], vosk_configs.get('sample_rate', 16000),
+                                 vosk_configs.get('blocksize') or VOSK_CHUNK * 10,
+                                 ring_seconds=isolation.get('ring_seconds', 2.0),
+                                 log_level=configs.get('log_level', 'INFO'), log_format=FORMAT)
+        decoder.start()
+        sessions = decoder.sessions
+    else:
+        from vosk_microphone_pi import load_model_async
+        # The model is the large memory cost, load it once for all the chairs.
+        model = load_model_async(model=configs['vosk_model_path'])
+        sessions = [build_session(configs, mode, model=model, device=chair.get('device')) for chair in chairs]
+    motions = load_motions(configs)
+
+    def log_stats(signum, frame):
+        for chair, session in zip(chairs, sessions):
+            logger.info(f"{chair.get('name')} audio queue: {session.queue.stats()}")
+
+    # kill -USR1 <pid> logs the audio queue counters.
+    signal.signal(signal.SIGUSR1, log_stats)
+
+    stop_services = None
+    handlers = []
+    pool = ThreadPoolExecutor(max_workers=len(chairs), thread_name_prefix='chair')
+    try:
+        # In the try, so that the decoder is stopped if a service fails (e.g. port in use).
+        stop_services = start_services(configs, sessions)
+        # After the service threads (metrics server, table watchers) are started, before the relay and audio
+        # threads are: threads inherit the scheduling policy of the thread that creates them.
+        if decoder is not None and isolation.get('rt_priority'):
+            set_realtime_priority(isolation['rt_priority'])
+        handlers = [cmd_handler(chair.get('relays'), motions) for chair in chairs]
+        # Keep one recognizer and one audio stream open per chair for all the commands.
+        for session in sessions:
+            session.open()
+        logger.info('Press Ctrl+C to stop the recording')
+        logger.debug(f'mode={mode}, {len(chairs)} chair(s)')
+        futures = [pool.submit(task_action, handler, session) for handler, session in zip(handlers, sessions)]
+        for future in futures:
+            future.result()
+    finally:
+        if stop_services is not None:
+            stop_services()
+        for session in sessions:
+            session.close()
+        if decoder is not None:
+            decoder.stop()
+        pool.shutdown()
+        for handler in handlers:
+            handler.shutdown()
+
+
+async def async_main_loop(configs, mode=None):
+    """``main_loop`` as an asyncio pipeline (``pipeline: asyncio`` in config.yml).
+
+    Every chair gets an AsyncRecognitionSession, whose commands go through an ``asyncio.Queue`` to an
+    async_cmd_handler; the sessions share one vosk model and one event loop, only decoding runs in threads.
+
+    Parameters
+    ----------
+    configs : dict
+        The loaded config.yml.
+
+    mode : str
+        'vosk', 'vad' or 'dtw', see ``build_gate``. The ``mode`` of config.yml by default.
+    """
+
+    from vosk_microphone_pi import AsyncRecognitionSession, load_model_async
+
+    chairs = configs.get('chairs') or [{'name': 'chair'}]
+    if (configs.get('isolation') or {}).get('enabled'):
+        logger.warning('isolation is not supported by the asyncio pipeline, decoding in this process')
+    model = load_model_async(model=configs['vosk_model_path'])
+    sessions = [AsyncRecognitionSession(build_session(configs, mode, model=model, device=chair.get('device')))
+                for chair in chairs]
+    motions = load_motions(configs)
+    handlers = [async_cmd_handler(chair.get('relays'), motions) for chair in chairs]
+
+    def log_stats():
+        for chair, session in zip(chairs, sessions):
+            logger.info(f"{chair.get('name')} audio queue: {session.stats()}")
+
+    # kill -USR1 <pid> logs the audio queue counters.
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, log_stats)
+
+    stop_services = None
+    tasks = []
+    try:
+        stop_services = start_services(configs, sessions)
+        for session in sessions:
+            await session.open()
+        logger.info('Press Ctrl+C to stop the recording')
+        logger.debug(f'mode={mode}, {len(chairs)} chair(s), asyncio')
+        for handler, session in zip(handlers, sessions):
+            commands = asyncio.Queue()
+            tasks += [asyncio.create_task(actuate(handler, commands)),
+                      asyncio.create_task(async_task_action(session, commands))]
+        # Until every session is done, the actuators never are.
+        await asyncio.gather(*tasks[1::2])
+    finally:
+        if stop_services is not None:
+            stop_services()
+        for session in sessions:
+            session.close()
+        for task in tasks:
+            task.cancel()
+        for handler in handlers:
+            handler.shutdown()
+
+
+if __name__ == '__main__':
+    configs = load_config('./config/config.yml')
+    # DEBUG logs every relay write and utterance, only for troubleshooting.
+    logging.basicConfig(level=configs.get('log_level', 'INFO'), format=FORMAT)
+
+    try:
+        if configs.get('pipeline') == 'asyncio':
+            asyncio.run(async_main_loop(configs))
+        else:
+            main_loop(configs)
+    except KeyboardInterrupt:
+        print('\nDone, exit')
+        exit(0)
@@ -1,30 +1,103 @@
 # coding=utf-8
 import os
+import hashlib
 import subprocess
 import time
 import threading
-import librosa
 import numpy as np
 import soundfile as sf
-import sounddevice as sd
 from collections import deque
-from dtw import dtw
 import logging
+from common import metrics
+from common.audio import MicrophoneSource
+from common.mfcc import mfcc
+from common.vad import frame_energy_db
 
-LOG_FORMAT = '%(asctime)-15s %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
-DEVICE = sd.query_devices(kind='input')
-DEVICE_NAME = DEVICE['name']
+WAKE_DTW = metrics.histogram('wake_dtw_seconds', 'Time of the MFCC and DTW of the wake-up word, per chunk')
 
 CHUNK = 4000  # Number of frames per buffer
 RATE = 16000  # Sampling frequency
 CHUNK_TIME = 1 / RATE * CHUNK
 CHANNELS = 1  # Mono
 
+N_MFCC = 20  # Number of MFCCs per frame
+N_FFT = 2048  # Analysis window of one MFCC frame (in samples)
+HOP_LENGTH = 512  # Hop between MFCC frames (in samples)
+STRIP_FRAME = 512  # Analysis frame of strip_silence (in samples)
+STRIP_HOP = 128  # Hop between strip_silence frames (in samples)
+STRIP_MARGIN_DB = 12.0  # How much louder than the noise floor speech frames are
+STRIP_MIN_DB = -50.0  # Frames quieter than this are never speech
+ENVELOPE_SEGMENT = 8  # Template frames per box of the DTW lower bound of closest_mfcc
+# Everything Voice.get_mfcc and Voice.get_stream_mfcc depend on, part of the key of cached features. Templates
+# are stripped before.
+MFCC_PARAMS = {'sr': RATE, 'n_mfcc': N_MFCC, 'n_fft': N_FFT, 'hop_length': HOP_LENGTH, 'front_end': 'common.mfcc',
+               'strip': (STRIP_FRAME, STRIP_HOP, STRIP_MARGIN_DB, STRIP_MIN_DB),
+               'mfcc': {'center': True, 'top_db': 80.0}, 'stream_mfcc': {'center': False, 'top_db': None}}
+
+
+def strip_silence(data: np.ndarray, frame_length: int = STRIP_FRAME, hop_length: int = STRIP_HOP,
+                  margin_db: float = STRIP_MARGIN_DB, min_db: float = STRIP_MIN_DB):
+    """Cut the leading and trailing silence of a signal.
+
+    The RMS of all the frames is computed at once by ``common.vad.frame_energy_db``, without a Python loop.
+    The noise floor is the 10th percentile of the frame energies, so it adapts to the recording; frames
+    ``margin_db`` louder than it (and louder than ``min_db``) are speech, and the signal is cut from the start
+    of the first speech frame to the end of the last one.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The wave data, int16 or float in [-1, 1].
+
+    frame_length : int
+        Length of analysis frame (in samples) for energy calculation.
+
+    hop_length : int
+        Samples between the starts of consecutive frames.
+
+    Returns
+    -------
+    data : np.ndarray
+        A view of the speech region of data, without copy; empty if there is no speech.
+    """
+
+    energy = frame_energy_db(data, frame_length, hop_length)
+    if not len(energy):
+        return data[:0]
+    floor = np.partition(energy, len(energy) // 10)[len(energy) // 10]
+    thresh = max(floor + margin_db, min_db)
+    speech = np.flatnonzero(energy > thresh)
+    if not len(speech):
+        return data[:0]
+    return data[speech[0] * hop_length:speech[-1] * hop_length + frame_length]
+
+
+def int16_to_float32(x: np.ndarray, out: np.ndarray = None):
+    """Scale int16 samples to float32 in [-1, 1].
+
+    Parameters
+    ----------
+    x : np.ndarray
+        int16 wave data.
+
+    out : np.ndarray
+        Optional float32 array of the length of x to write into, so that nothing is allocated.
+
+    Returns
+    -------
+    data : np.ndarray
+        The float32 wave data, out if given.
+    """
+
+    return np.multiply(x, np.float32(1 / 2 ** 15), out=out, dtype=np.float32)
+
+
 def convert_strip(frames: [list, deque], frame_length: int = CHUNK, hop_length: int = CHUNK // 2):
-    """Convert raw audio data(bytes) into integers and strip silence.
+    """Convert raw audio data(bytes) into floats and strip silence.
+
+    The silence is stripped from the int16 samples, so only the speech is converted.
 
     Parameters
     ----------
@@ -40,20 +113,141 @@ def convert_strip(frames: [list, deque], frame_length: int = CHUNK, hop_length:
     Returns
     -------
     data : np.ndarray
-        The new wave data without silence.
+        The new float32 wave data without silence.
     """
 
-    data = b''.join(frames)
-    data = np.frombuffer(data, np.int16) / 2 ** 15
-    data = strip_silence(data, frame_length, hop_length)
-    # data = data.astype(np.int16)
-    return data
+    data = np.frombuffer(b''.join(frames), np.int16)
+    return int16_to_float32(strip_silence(data, frame_length, hop_length))
+
+
+def _cost_matrix(a: np.ndarray, b: np.ndarray):
+    return np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=-1))
+
+
+def _boxes(frames: np.ndarray, seg: int = ENVELOPE_SEGMENT):
+    # Per-coefficient min and max of every seg consecutive frames, the last box padded with the last frame.
+    k = -(-len(frames) // seg)
+    padded = np.concatenate((frames, np.repeat(frames[-1:], k * seg - len(frames), axis=0))).reshape(k, seg, -1)
+    return padded.min(axis=1), padded.max(axis=1)
+
+
+def _box_distance2(frames: np.ndarray, lo: np.ndarray, hi: np.ndarray):
+    # Squared distance of every frame to every box, shape (len(frames), len(lo)): to the nearest point of the
+    # box, the frame clipped into it. One temporary, reused in place.
+    diff = np.clip(frames[:, None], lo[None], hi[None])
+    np.subtract(frames[:, None], diff, out=diff)
+    return np.einsum('ijk,ijk->ij', diff, diff)
+
+
+def _envelope_bounds(query: np.ndarray, templates: list):
+    # Every warping path visits each row and each column at least once, and a frame is at least as far from a
+    # frame of the other sequence as from the box around it and its neighbours (LB_Keogh envelopes, without a
+    # warping window). So the sum of the distances of the query frames to the nearest box of a template, and
+    # the other way round, bound the path cost. For all the templates at once, with a box per ENVELOPE_SEGMENT
+    # frames this is several times cheaper than the cost matrices.
+    boxes = [_boxes(t) for t in templates]
+    starts = np.cumsum([0] + [len(lo) for lo, _ in boxes[:-1]])
+    lo, hi = np.concatenate([lo for lo, _ in boxes]), np.concatenate([hi for _, hi in boxes])
+    rows = np.sqrt(np.minimum.reduceat(_box_distance2(query, lo, hi), starts, axis=1)).sum(axis=0)
+    starts = np.cumsum([0] + [len(t) for t in templates[:-1]])
+    cols = np.add.reduceat(np.sqrt(_box_distance2(np.concatenate(templates), *_boxes(query)).min(axis=1)), starts)
+    return np.maximum(rows, cols) / (len(query) + np.array([len(t) for t in templates]))
+
+
+def _lower_bound(cost: np.ndarray):
+    # The same argument with the exact row and column minima, once the cost matrix is computed.
+    n, m = cost.shape
+    return max(cost.min(axis=1).sum(), cost.min(axis=0).sum()) / (n + m)
+
+
+def _dtw_from_cost(cost: np.ndarray, cutoff: float = float('inf')):
+    # Same result as dtw(..., dist_method='euclidean').normalizedDistance (symmetric2 step pattern, normalized
+    # by n + m), one row at a time. Costs only grow along a row, so the calculation is abandoned (inf) as soon
+    # as every cell of a row is above cutoff.
+    n, m = cost.shape
+    limit = cutoff * (n + m)
+    row = np.cumsum(cost[0])
+    t = np.empty(m)
+    for c in cost[1:]:
+        # Diagonal (weight 2) and vertical steps come from the previous row ...
+        t[0] = row[0] + c[0]
+        np.minimum(row[:-1] + 2 * c[1:], row[1:] + c[1:], out=t[1:])
+        # ... horizontal steps are a running minimum: D[j] = P[j] + min(t[k] - P[k] for k <= j).
+        p = np.cumsum(c)
+        row = np.minimum.accumulate(t - p) + p
+        if row.min() > limit:
+            return float('inf')
+    return row[-1] / (n + m)
+
+
+def _closest_group(query: np.ndarray, templates: list):
+    score = float('inf')
+    closest = None
+    if not templates:
+        return score, closest
+    bounds = _envelope_bounds(query, templates)
+
+    # The most promising templates first, so the cutoff gets tight early. The cost matrix of a template is only
+    # computed once its cheap bound is below the best score.
+    for i in sorted(range(len(templates)), key=bounds.__getitem__):
+        if bounds[i] >= score:
+            break
+        cost = _cost_matrix(query, templates[i])
+        if _lower_bound(cost) >= score:
+            continue
+        s = _dtw_from_cost(cost, cutoff=score)
+        if s < score:
+            score = s
+            closest = i
+    return score, closest
+
+
+def closest_mfcc(query: np.ndarray, templates: list, pool: 'multiprocessing.pool.Pool' = None):
+    """Find the template feature sequence closest to query.
+
+    Templates are visited in order of a lower bound of their distance, from envelopes of the sequences that
+    are cheaper than their cost matrices; a template is skipped when its bound is not below the best score so
+    far, its cost matrix is only computed otherwise, and its DTW is abandoned as soon as it cannot beat it.
 
+    Parameters
+    ----------
+    query : np.ndarray [shape=(t, n_mfcc)]
+        The feature sequence to match.
 
-# Not used
-def find_closest(voice: 'Voice', template_voices: list, need_strip=False):
+    templates : list
+        The template feature sequences.
+
+    pool : multiprocessing.pool.Pool
+        If given, the templates are split into one group per CPU, matched in the pool.
+
+    Returns
+    -------
+    score : float
+        The normalized DTW distance to the closest template.
+
+    index : int
+        The index of the closest template, None if there are no templates.
+    """
+
+    if pool is None:
+        return _closest_group(query, templates)
+
+    n = os.cpu_count() or 1
+    results = pool.starmap(_closest_group, [(query, templates[k::n]) for k in range(n)])
+    score = float('inf')
+    closest = None
+    for k, (s, i) in enumerate(results):
+        if i is not None and s < score:
+            score = s
+            closest = k + i * n
+    return score, closest
+
+
+def find_closest(voice: 'Voice', template_voices: list, need_strip=False, pool=None):
     """Finding the most similar template voice to the "voice".
 
+    The MFCC of "voice" is computed once and matched against all templates with ``closest_mfcc``.
+
     Parameters
     ----------
     voice : Voice
@@ -65,30 +259,316 @@ def find_closest(voice: 'Voice', template_voices: list, need_strip=False):
     need_strip : bool
         Whether the "voice" needs to be stripped.
 
+    pool : multiprocessing.pool.Pool
+        Optional process pool to spread the templates over.
+
     Returns
     -------
-    score : DTW.normalizedDistance
+    score : float
         The normalized DTW distance.
 
     closest_voice :
          The most similar template voice.
     """
 
-    score = float('inf')
-    closest_voice = None
+    if need_strip:
+        stripped = strip_silence(voice.wave_data)
+        if not len(stripped):
+            return float('inf'), None
+        voice = Voice(stripped)
+    score, i = closest_mfcc(voice.get_mfcc().T, [t.get_mfcc().T for t in template_voices], pool=pool)
+    return score, (None if i is None else template_voices[i])
 
-    for t in template_voices:
-        try:
-            s = t.dtw_with(another=voice)
-        except Exception as e:
-            logger.error(e)
-        else:
 
-            if s.normalizedDistance < score:
-                score = s.normalizedDistance
-                closest_voice = t
+class AudioRing:
+    """Preallocated int16 buffer holding the last ``capacity`` samples of an audio stream.
+
+    New audio is read straight into the buffer and the most recent samples are always one contiguous slice
+    of it, so readers get views instead of copies. The buffer is ``slack`` times larger than needed; when the
+    end is reached the last ``capacity`` samples are moved back to the start, once every
+    ``(slack - 1) * capacity`` samples.
+
+    Attributes
+    ----------
+    capacity : int
+        The number of samples that can always be looked back at.
+
+    total : int
+        The number of samples written since the last ``clear``.
+    """
+
+    def __init__(self, capacity: int, slack: int = 4):
+        self.capacity = capacity
+        self.total = 0
+        self._buf = np.zeros(capacity * slack, dtype=np.int16)
+        self._end = 0
+
+    def clear(self):
+        self.total = 0
+        self._end = 0
+
+    def _slot(self, n: int):
+        if self._end + n > len(self._buf):
+            keep = min(self._end, self.capacity)
+            self._buf[:keep] = self._buf[self._end - keep:self._end]
+            self._end = keep
+        return self._buf[self._end:self._end + n]
+
+    def _commit(self, n: int):
+        self._end += n
+        self.total += n
+
+    def write(self, samples: np.ndarray):
+        """Copy samples into the buffer."""
+
+        self._slot(len(samples))[:] = samples
+        self._commit(len(samples))
+
+    def read_from(self, source: 'MicrophoneSource', n: int):
+        """Read n samples of a started audio source directly into the buffer.
+
+        Returns
+        -------
+        overflowed : bool
+            True if input data was discarded since the previous read.
+
+        Raises
+        ------
+        EOFError:
+            When a replayed source runs out of audio.
+        """
+
+        overflowed = source.read_into(self._slot(n))
+        self._commit(n)
+        return overflowed
+
+    def last(self, n: int):
+        """A view of the last n samples (at most ``capacity``), valid until the next write."""
+
+        n = min(n, self.total, self.capacity)
+        return self._buf[self._end - n:self._end]
+
+    def last_seconds(self, seconds: float, rate: int = RATE):
+        """A view of the last secs of audio."""
+
+        return self.last(int(seconds * rate))
+
+
+class StreamingMFCC:
+    """Incremental MFCC front end for an audio stream.
+
+    Only the audio that arrived since the last ``push`` is analysed: the samples that do not yet fill a whole
+    frame are kept until the next call, and the new MFCC frames are appended to a ring buffer that holds the
+    last ``capacity`` frames.
+
+    Attributes
+    ----------
+    rate : int
+        The sample rate of the audio stream.
+
+    capacity : int
+        The number of MFCC frames kept in the ring buffer.
+
+    _pending : np.ndarray
+        Samples passed to ``push`` not yet covered by a complete frame.
+
+    _consumed : int
+        Samples of the AudioRing passed to ``consume`` covered by complete frames.
+
+    _scratch : np.ndarray
+        float32 copy of the last int16 signal passed to ``features``, grown as needed.
+
+    _ring : np.ndarray [shape=(2 * capacity, n_mfcc)]
+        float32 ring buffer of MFCC frames. Every frame is written twice, ``capacity`` rows apart, so that the last
+        ``capacity`` frames are always a contiguous slice.
+    """
+
+    def __init__(self, rate=RATE, capacity=None, n_mfcc=N_MFCC, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.rate = rate
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        # 2 secs of frames by default, the same as the sliding window of Listener.
+        self.capacity = capacity or int(2 * rate / hop_length)
+        self._mfcc = mfcc(rate, n_fft, hop_length, n_mfcc)
+        self._ring = np.zeros((2 * self.capacity, n_mfcc), np.float32)
+        self._pos = 0
+        self._count = 0
+        self._pending = np.zeros(0, np.float32)
+        self._consumed = 0
+        self._scratch = np.empty(0, np.float32)
+
+    def reset(self):
+        self._pos = 0
+        self._count = 0
+        self._pending = np.zeros(0, np.float32)
+        self._consumed = 0
+
+    def features(self, y: np.ndarray):
+        """Compute the MFCC frames of a complete signal, without touching the stream state.
+
+        Unlike ``Voice.get_mfcc``, frames are not centered and the dB scale is not clipped relative
+        to the loudest frame, so the frames of a signal do not depend on how it is split into chunks.
+
+        int16 data is scaled into a float32 scratch buffer reused from call to call, and the whole front end
+        runs in float32 (float64 data is analysed in float64), see ``common.mfcc.MFCC``.
+
+        Parameters
+        ----------
+        y : np.ndarray
+            The wave data, float or int16.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            MFCC sequence
+        """
+
+        if y.dtype == np.int16:
+            if len(self._scratch) < len(y):
+                self._scratch = np.empty(len(y), np.float32)
+            y = int16_to_float32(y, out=self._scratch[:len(y)])
+        return self._mfcc(y, center=False, top_db=None)
+
+    def push(self, samples: np.ndarray):
+        """Analyse newly arrived audio.
+
+        Parameters
+        ----------
+        samples : np.ndarray
+            The new wave data, float or int16.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            The MFCC frames completed by the new audio, possibly none.
+        """
+
+        buf = np.concatenate((self._pending, samples)) if len(self._pending) else np.asarray(samples)
+        mfcc, used = self._analyse(buf)
+        self._pending = buf[used:]
+        return mfcc
+
+    def consume(self, ring: AudioRing):
+        """Analyse the audio written to ring since the last call.
+
+        The samples are read through a view on the ring, so nothing is copied before the STFT. ring must be
+        able to hold the unfinished frame plus one chunk.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            The MFCC frames completed by the new audio, possibly none.
+        """
+
+        mfcc, used = self._analyse(ring.last(ring.total - self._consumed))
+        self._consumed += used
+        return mfcc
+
+    def _analyse(self, buf: np.ndarray):
+        if len(buf) < self.n_fft:
+            return np.zeros((0, self.n_mfcc), np.float32), 0
+
+        n_frames = 1 + (len(buf) - self.n_fft) // self.hop_length
+        end = (n_frames - 1) * self.hop_length + self.n_fft
+        mfcc = self.features(buf[:end])
+
+        for frame in mfcc[-self.capacity:]:
+            self._ring[self._pos] = frame
+            self._ring[self._pos + self.capacity] = frame
+            self._pos = (self._pos + 1) % self.capacity
+        self._count = min(self._count + len(mfcc), self.capacity)
+        return mfcc, n_frames * self.hop_length
+
+    def frames(self):
+        """The buffered MFCC frames, oldest first.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            A view on the ring buffer, valid until the next ``push``.
+        """
 
-    return score, closest_voice
+        end = self._pos + self.capacity
+        return self._ring[end - self._count:end]
+
+
+class SubsequenceDTW:
+    """Streaming subsequence DTW of a template against an endless sequence of frames.
+
+    The match may begin and end at any frame of the stream. Every stream frame advances the warping path by
+    one step while the template advances by 0, 1 or 2 frames, so the cost of a new frame only depends on the
+    previous column and is computed for all template frames at once. ``update`` therefore costs the same
+    for every hop, however long the stream has been running.
+
+    Attributes
+    ----------
+    template : np.ndarray [shape=(m, n_mfcc)]
+        The template sequence.
+
+    max_len : int
+        The longest match (in stream frames), 2 times the template by default.
+
+    _cost : np.ndarray [shape=(m,)]
+        Accumulated cost of the best path ending at each template frame and the last stream frame.
+
+    _length : np.ndarray [shape=(m,)]
+        Length (in stream frames) of those paths.
+    """
+
+    def __init__(self, template: np.ndarray, max_len=None):
+        self.template = np.asarray(template)
+        self.max_len = max_len or 2 * len(self.template)
+        self.reset()
+
+    def reset(self):
+        m = len(self.template)
+        self._cost = np.full(m, np.inf, self.template.dtype)
+        self._length = np.zeros(m, dtype=int)
+
+    def update(self, frames: np.ndarray):
+        """Extend the alignment with new stream frames.
+
+        Parameters
+        ----------
+        frames : np.ndarray [shape=(t, n_mfcc)]
+            The new frames of the stream.
+
+        Returns
+        -------
+        distance : float
+            The lowest normalized distance (accumulated cost / match length) of a match of the whole template
+            ending at one of the new frames, inf if there is none.
+        """
+
+        best = np.inf
+        if not len(frames):
+            return best
+
+        dist = np.sqrt(((frames[:, None, :] - self.template[None, :, :]) ** 2).sum(axis=-1))
+        cost, length = self._cost, self._length
+        # Candidates: stay on template frame i, or come from i - 1 or i - 2.
+        prev = np.full((3, len(cost)), np.inf, cost.dtype)
+        prev_len = np.zeros((3, len(cost)), dtype=int)
+        cols = np.arange(len(cost))
+        for d in dist:
+            prev[0] = cost
+            prev[1, 1:] = cost[:-1]
+            prev[2, 2:] = cost[:-2]
+            prev_len[0] = length
+            prev_len[1, 1:] = length[:-1]
+            prev_len[2, 2:] = length[:-2]
+            step = prev.argmin(axis=0)
+            cost = d + prev[step, cols]
+            length = prev_len[step, cols] + 1
+            # Open begin: a match can start at the first template frame on any stream frame.
+            cost[0] = d[0]
+            length[0] = 1
+            cost[length > self.max_len] = np.inf
+            best = min(best, cost[-1] / length[-1])
+
+        self._cost, self._length = cost, length
+        return best
 
 
 class Listener:
@@ -111,81 +591,117 @@ class Listener:
     template : Voice
         The template audio file for wakeup word recognition.
 
-    thresh : int
-        The threshold when recognizing wakeup word. Set ```thresh=0``` for finding proper threshold.
+    templates : list
+        All the templates. With more than one (several speakers or phrasings), every hop the speech of the last
+        2 secs (cut by ``strip_silence``) is matched against all of them with ``closest_mfcc`` instead of
+        streaming DTW.
+
+    pool : multiprocessing.pool.Pool
+        Optional process pool for matching many templates.
+
+    source : MicrophoneSource, WavSource
+        A started audio source to listen to. If None, a MicrophoneSource is opened for each ``listening``.
+
+    thresh : float
+        The wake-up word is found when the distance falls below it, see ``SubsequenceDTW.update`` (or
+        ``closest_mfcc`` with several templates). Set ```thresh=0``` and log at DEBUG to find a proper threshold.
+        The scale is not the ``normalizedDistance`` of dtw-python that ``listening`` used before.
 
     _wakeup : bool
         The flag indicating whether Petoi is waken up.
 
-    _frame_window : deque
-        The sliding window that contains 2 secs of audio data.
+    _audio : AudioRing
+        The last 5 secs of audio data, read directly from the source.
+
+    _mfcc : StreamingMFCC
+        The MFCC front end, fed with every chunk of audio data.
+
+    _dtw : SubsequenceDTW
+        Matches the template against the MFCC frames of the stream.
+
+    _template_mfcc : list
+        The MFCC frames of all the templates.
 
-    _frames : deque
-        A deque for storing audio data chunks during listening.
+    _new_frames : int
+        MFCC frames computed since the templates were last matched, in multi-template mode.
     """
 
-    def __init__(self, template: 'Voice', chunk=CHUNK, n_channels=CHANNELS, rate=RATE, thresh=0):
+    def __init__(self, template: ['Voice', list], chunk=CHUNK, n_channels=CHANNELS, rate=RATE, thresh=0,
+                 pool=None, source=None):
         self.chunk = chunk
         self.channels = n_channels
         self.rate = rate
         self.window_size = int(2 / CHUNK_TIME)
-        self.template = template
+        self.templates = list(template) if isinstance(template, (list, tuple)) else [template]
+        self.template = self.templates[0]
+        self.pool = pool
+        self.source = source
         self.thresh = thresh  # Set 0 For finding proper thresh
         self._wakeup = False
-        self._frame_window = deque([], maxlen=self.window_size)
-        #
-        self._frames = deque([], maxlen=int(5 / CHUNK_TIME))
-        logger.debug(f'Listener Wake-up word template：{self.template.file_path}')
+        self._audio = AudioRing(5 * rate)
+        self._mfcc = StreamingMFCC(rate=rate)
+        self._template_mfcc = [t.get_stream_mfcc() for t in self.templates]
+        self._dtw = SubsequenceDTW(self._template_mfcc[0])
+        self._new_frames = 0
+        logger.debug(f'Listener Wake-up word templates：{[t.file_path for t in self.templates]}')
 
     def listening(self):
         """The function for recognizing wakeup word from real-time audio data.
 
+        Only the MFCC frames of each new chunk are computed, and the template is matched against the stream
+        by streaming subsequence DTW, so every chunk costs the same.
+
         Returns
         -------
-        result : dtw.DTW
-            The DTW object that contains results of dtw(distance) calculation.
+        distance : float
+            The distance of the last checked chunk (no longer a ``dtw.DTW`` object).
         """
 
-        result = ''
+        distance = float('inf')
         self.reset()
-        stream = sd.RawInputStream(samplerate=self.rate, device=DEVICE_NAME, blocksize=self.chunk,
-                                   channels=1, dtype='int16')
-        stream.start()
-
-        while not self._wakeup:
-            data = stream.read(self.chunk)
-            self._frames.append(data[0])
-
-            if len(self._frames) > self.window_size:
-                # print('start')
-                if self._frame_window:
-                    count = self.window_size // 2
-                    # pop half of the data in sliding window
-                    for i in range(count):
-                        self._frame_window.popleft()
-                    # then insert new audio data to be recognized
-                    for i in range(count):
-                        self._frame_window.append(self._frames.popleft())
-                else:
-                    # when sliding window is not full and there are existing cached frames,
-                    # add the cached frames into the sliding window.
-                    while len(self._frame_window) < self.window_size and len(self._frames) > 0:
-                        self._frame_window.append(self._frames.popleft())
-                signal = convert_strip(self._frame_window, self.chunk, self.chunk // 2)
-                # for now signal is a float ndarray
-                v = Voice(signal)
-                s = time.time()
-                result = v.dtw_with(self.template)
-                logger.debug(f'len(_frames)={len(self._frames)}, DTW time cost: {time.time()-s}s, '
-                             f'DTW.normalizedDistance={result.normalizedDistance}')
-                if result.normalizedDistance < self.thresh:
+        source = self.source
+        if source is None:
+            source = MicrophoneSource(sample_rate=self.rate, blocksize=self.chunk)
+            source.start()
+
+        try:
+            while not self._wakeup:
+                try:
+                    self._audio.read_from(source, self.chunk)
+                except EOFError:
+                    # A replayed source ran out of audio.
+                    break
+                s = time.perf_counter()
+                distance = self._match(self._mfcc.consume(self._audio))
+                WAKE_DTW.observe(time.perf_counter() - s)
+                logger.debug('wake-up word distance %.1f', distance)
+                if distance < self.thresh:
                     logger.info('WakeUp')
                     self.wakeup()
+        finally:
+            if self.source is None:
+                source.stop()
 
-        stream.stop()
-        stream.close()
         logger.info("End monitoring")
-        return result
+        return distance
+
+    def _match(self, frames: np.ndarray):
+        if len(self.templates) == 1:
+            return self._dtw.update(frames)
+
+        # Hop by half of the buffered window, like the single window used to.
+        self._new_frames += len(frames)
+        if self._new_frames < self._mfcc.capacity // 2:
+            return float('inf')
+        self._new_frames = 0
+        # Match only the speech of the window, like the stripped templates; a silent window is not matched.
+        window = strip_silence(self._audio.last_seconds(2, self.rate))
+        if len(window) < self._mfcc.n_fft:
+            return float('inf')
+        score, i = closest_mfcc(self._mfcc.features(window), self._template_mfcc, pool=self.pool)
+        if i is not None:
+            logger.debug(f'closest template: {self.templates[i].file_path}')
+        return score
 
     def wakeup(self):
         self._wakeup = True
@@ -195,8 +711,137 @@ class Listener:
 
     def reset(self):
         self._wakeup = False
-        self._frames.clear()
-        self._frame_window.clear()
+        self._audio.clear()
+        self._mfcc.reset()
+        self._dtw.reset()
+        self._new_frames = 0
+
+
+class WakeWordGate:
+    """The wake-up word template as the first stage in front of the vosk recognizer.
+
+    Has the interface of ``common.vad.EnergyVAD``: every block of the stream is matched against the template
+    by streaming DTW, and nothing is passed to the recognizer until the wake-up word is found. The last
+    ``preroll`` seconds, the wake-up word included, are passed then, followed by ``window`` seconds of audio
+    for the command; then the gate closes and matching starts over.
+
+    Attributes
+    ----------
+    thresh : float
+        The DTW distance below which the template matches.
+
+    active : bool
+        Whether blocks are passed to the recognizer.
+
+    passed, gated : int
+        Samples passed to the recognizer, and held back.
+    """
+
+    def __init__(self, template: 'Voice', thresh: float, rate=RATE, preroll=1.5, window=4.0):
+        self.thresh = thresh
+        self.rate = rate
+        self.preroll = int(preroll * rate)
+        self.window = int(window * rate)
+        self.active = False
+        self.passed = 0
+        self.gated = 0
+        self._remaining = 0
+        self._audio = AudioRing(max(self.preroll, rate))
+        self._mfcc = StreamingMFCC(rate=rate)
+        self._dtw = SubsequenceDTW(template.get_stream_mfcc())
+
+    def filter(self, data: bytes):
+        """Gate one block of audio, as ``EnergyVAD.filter``."""
+
+        x = np.frombuffer(data, np.int16)
+        if not self.active:
+            s = time.perf_counter()
+            self._audio.write(x)
+            distance = self._dtw.update(self._mfcc.consume(self._audio))
+            WAKE_DTW.observe(time.perf_counter() - s)
+            if distance >= self.thresh:
+                self.gated += len(x)
+                return b''
+            logger.info(f'WakeUp, DTW.normalizedDistance={distance}')
+            self.active = True
+            self._remaining = self.window
+            data = self._audio.last(self.preroll).tobytes()
+            self.gated -= len(data) // 2 - len(x)
+        else:
+            self._remaining -= len(x)
+            if self._remaining <= 0:
+                self.active = False
+                self._audio.clear()
+                self._mfcc.reset()
+                self._dtw.reset()
+        self.passed += len(data) // 2
+        return data
+
+
+class FeatureCache:
+    """On-disk cache of the wave data and MFCCs of template wav files.
+
+    Entries are ``.npy`` files in ``cache_dir``, named after the wav file, a hash of its path relative to the
+    parent of ``cache_dir`` (so that same-named files of different folders have their own entries), and a hash
+    of its content and of ``MFCC_PARAMS``, so they are invalidated when either changes. Entries are loaded
+    memory-mapped.
+
+    Attributes
+    ----------
+    cache_dir : str
+        The directory holding the cache files.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def for_recordings(cls, recording_path: str):
+        """The cache next to the recordings in ``recording_path`` (see config.yml)."""
+
+        return cls(os.path.join(recording_path, '.cache'))
+
+    def key(self, file_path: str):
+        """The name of the cache entry of a wav file, for its current content."""
+
+        path = os.path.relpath(os.path.abspath(file_path), os.path.dirname(os.path.abspath(self.cache_dir)))
+        path_hash = hashlib.sha1(path.encode()).hexdigest()[:8]
+        h = hashlib.sha1(repr(sorted(MFCC_PARAMS.items())).encode())
+        with open(file_path, 'rb') as f:
+            h.update(f.read())
+        return f'{os.path.basename(file_path)}.{path_hash}.{h.hexdigest()[:16]}'
+
+    def load(self, key: str):
+        """Load the arrays of an entry.
+
+        Returns
+        -------
+        arrays : dict{ str:np.memmap }
+            The arrays of the entry by name, None if the entry does not exist.
+        """
+
+        paths = {name: os.path.join(self.cache_dir, f'{key}.{name}.npy') for name in ('wave', 'mfcc', 'stream_mfcc')}
+        try:
+            return {name: np.load(path, mmap_mode='r') for name, path in paths.items()}
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, key: str, **arrays):
+        """Store the arrays of an entry, replacing stale entries of the same wav file."""
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = key.rsplit('.', 1)[0]
+        for f in os.listdir(self.cache_dir):
+            if f.startswith(name + '.') and not f.startswith(key + '.'):
+                os.remove(os.path.join(self.cache_dir, f))
+        for array_name, array in arrays.items():
+            path = os.path.join(self.cache_dir, f'{key}.{array_name}.npy')
+            # Write aside and rename, so a crash never leaves a truncated entry behind.
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+
 
 class Voice:
     """Class for storing and manipulating wave data.
@@ -209,14 +854,17 @@ class Voice:
     mfcc : np.ndarray
         Sequence of mfcc feature of the wave data.
 
+    stream_mfcc : np.ndarray
+        The MFCC frames of the wave data as ``StreamingMFCC`` computes them, see ``get_stream_mfcc``.
+
     wave_data : np.ndarray
-        The wave data.
+        The wave data. Loaded from a file, its leading and trailing silence is cut by ``strip_silence``.
 
     sample_rate : int
         The rate of the wave data/file.
     """
 
-    def __init__(self, path_or_data):
+    def __init__(self, path_or_data, cache: FeatureCache = None):
         """Constructor of class Voice.
 
         If the constructor get an str, that means it gets the path to the wav file.
@@ -226,16 +874,24 @@ class Voice:
         Parameters
         ----------
         path_or_data : str, list, np.ndarray, bytes
+
+        cache : FeatureCache
+            If given, the wave data and both MFCC sequences of a wav file are loaded from/stored to the cache.
         """
 
         if isinstance(path_or_data, str):
             self.file_path = None
             self.mfcc = None
-            self.__load_data(path_or_data)
+            self.stream_mfcc = None
+            if cache is None:
+                self.__load_data(path_or_data)
+            else:
+                self.__load_cached(path_or_data, cache)
         elif isinstance(path_or_data, (list, np.ndarray, bytes)):
             logger.debug("Voice's constructor got audio data")
             self.file_path = None
             self.mfcc = None
+            self.stream_mfcc = None
             self.wave_data = path_or_data
             self.sample_rate = RATE
 
@@ -257,7 +913,17 @@ class Voice:
         """
 
         try:
-            self.wave_data, self.sample_rate = librosa.load(file_path, sr=RATE)
+            self.wave_data, self.sample_rate = sf.read(file_path, dtype='float32')
+            if self.wave_data.ndim > 1:
+                self.wave_data = self.wave_data.mean(axis=1)
+            if self.sample_rate != RATE:
+                # librosa (and numba) is only imported for the recordings that need resampling.
+                import librosa
+                self.wave_data = librosa.resample(self.wave_data, orig_sr=self.sample_rate, target_sr=RATE)
+                self.sample_rate = RATE
+            stripped = strip_silence(self.wave_data)
+            if len(stripped):
+                self.wave_data = stripped
             self.n_frames = len(self.wave_data)
             self.file_path = file_path
             self.name = os.path.basename(file_path)  # Record the file name
@@ -265,6 +931,24 @@ class Voice:
         except Exception as e:
             raise e
 
+    def __load_cached(self, file_path: str, cache: FeatureCache):
+        """Load wave data and MFCCs from the cache, loading the file and filling the cache on a miss."""
+
+        key = cache.key(file_path)
+        arrays = cache.load(key)
+        if arrays is None:
+            self.__load_data(file_path)
+            cache.store(key, wave=self.wave_data, mfcc=self.get_mfcc(), stream_mfcc=self.get_stream_mfcc())
+            return
+
+        self.wave_data = arrays['wave']
+        self.mfcc = arrays['mfcc']
+        self.stream_mfcc = arrays['stream_mfcc']
+        self.sample_rate = RATE
+        self.n_frames = len(self.wave_data)
+        self.file_path = file_path
+        self.name = os.path.basename(file_path)
+
     def dtw_with(self, another: 'Voice'):
         """Calculate and return the DTW distance between self and another(Voice).
 
@@ -278,6 +962,8 @@ class Voice:
         An object of class ``DTW``.
         """
 
+        # dtw-python pulls in scipy, only imported by the modes that use it.
+        from dtw import dtw
         return dtw(another.get_mfcc().T, self.get_mfcc().T, dist_method='euclidean')
 
     def get_mfcc(self):
@@ -290,15 +976,27 @@ class Voice:
         """
 
         if self.mfcc is None:
-            self.mfcc = librosa.feature.mfcc(y=self.wave_data, sr=self.sample_rate, n_mfcc=20)
+            self.mfcc = mfcc(self.sample_rate, N_FFT, HOP_LENGTH, N_MFCC)(self.wave_data).T
         return self.mfcc
 
+    def get_stream_mfcc(self):
+        """Calculate and cache the MFCC frames of the wave data as ``StreamingMFCC.features`` computes them.
+
+        Returns
+        -------
+        mfcc : np.ndarray [shape=(t, n_mfcc)]
+            MFCC sequence, not centered nor clipped; the template of ``Listener`` and ``WakeWordGate``.
+        """
+
+        if self.stream_mfcc is None:
+            self.stream_mfcc = StreamingMFCC(rate=self.sample_rate).features(self.wave_data)
+        return self.stream_mfcc
+
     def play(self):
         """Play the loaded wave data as sound.
         """
 
-        # sounddevice needs int16 while librosa uses float
-        data = self.wave_data * 2**15
-        data = data.astype(np.int16)
-        sd.play(data, self.sample_rate)
+        # sounddevice plays the float32 wave data as it is, without an int16 copy.
+        import sounddevice as sd
+        sd.play(self.wave_data, self.sample_rate)
         sd.wait()
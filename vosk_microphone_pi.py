@@ -1,21 +1,27 @@
 import os
 import sys
+import asyncio
+import json
 import logging
 import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 # import numpy as np
 import vosk
-import sounddevice as sd
-from common.cmd_lookup import text2cmd
+from common import metrics
+from common.audio import AudioQueue, MicrophoneSource, input_device
+from common.cmd_lookup import text2cmd, CommandMatcher
 
 
-FORMAT = '%(asctime)-15s %(name)s - %(levelname)s - %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=FORMAT)
 logger = logging.getLogger(__name__)
 
-device = sd.query_devices(kind='input')
-device_name = device['name']
-logger.info(device)
-# device_index = device['index']
+AUDIO_CALLBACK = metrics.histogram('voice_audio_callback_seconds', 'Time in the audio callback, per block')
+QUEUE_WAIT = metrics.histogram('voice_queue_wait_seconds', 'Time from the capture of a block to the recognizer')
+GATE = metrics.histogram('voice_gate_seconds', 'Time in the first stage (vad or dtw), per block')
+DECODE = metrics.histogram('voice_decode_seconds', 'Time in KaldiRecognizer.AcceptWaveform, per call')
+TEXT2CMD = metrics.histogram('voice_text2cmd_seconds', 'Time mapping a final result to its command')
+COMMANDS = metrics.counter('voice_commands_total', 'Commands recognized and accepted')
+REJECTED = metrics.counter('voice_commands_rejected_total', 'Commands rejected for a low confidence')
 
 q = queue.Queue()
 
@@ -25,9 +31,10 @@ def load_model(model):
 
     Parameters
     ----------
-    model : str, vosk.Model
+    model : str, vosk.Model, concurrent.futures.Future
         Getting an str means the function gets the path of vosk.Model. Getting a vosk.Model means the model has
-        been loaded once so just return itself.
+        been loaded once so just return itself. Getting a Future (see ``load_model_async``) means the model is
+        being loaded, so wait for it.
 
     Returns
     -------
@@ -53,10 +60,58 @@ def load_model(model):
             raise FileNotFoundError('model not found, please correct the path.')
     elif isinstance(model, vosk.Model):
         return model
+    elif isinstance(model, Future):
+        return model.result()
     else:
         raise ValueError('Unknown error while loading model.')
 
 
+def load_model_async(model):
+    """Start loading the vosk model in a background thread.
+
+    Loading the model takes seconds on a Pi and mostly runs in native code, so the audio stream can be opened
+    meanwhile.
+
+    Parameters
+    ----------
+    model : str, vosk.Model
+        As for ``load_model``.
+
+    Returns
+    -------
+    future : concurrent.futures.Future
+        Resolves to the loaded vosk.Model. Can be passed to ``load_model`` and ``RecognitionSession``.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(load_model, model)
+    executor.shutdown(wait=False)
+    return future
+
+
+def parse_result(res):
+    """Parse a final result of the recognizer.
+
+    Parameters
+    ----------
+    res : str
+        The JSON of ``KaldiRecognizer.Result()``, with the words and their confidences if ``SetWords(True)``
+        was called.
+
+    Returns
+    -------
+    text : str
+        The recognized text.
+
+    confidence : float
+        The lowest confidence of the recognized words, [unk] excluded; 1.0 without word results.
+    """
+
+    result = json.loads(res)
+    words = [w['conf'] for w in result.get('result', ()) if w['word'] != '[unk]']
+    return result.get('text', ''), min(words, default=1.0)
+
+
 def callback(in_data, frames, time, status):
     """This is called (from a separate thread) for each audio block.
 
@@ -121,14 +176,15 @@ def action_listen(cmd_handler, model, sample_rate, cmd_table, d, chunk):
 
     if sample_rate is None:
         # Get the default audio input device of your system.
-        device_info = sd.query_devices(device, 'input')
+        device_info = input_device()
         # soundfile expects an int, sounddevice provides a float.
         sample_rate = int(device_info['default_sample_rate'])
 
     # The 3rd argument(can be omitted) is a custom dictionary including all candidate words/characters.
     rec = vosk.KaldiRecognizer(model, sample_rate, d)
     # Open a stream and read real-time audio stream data.
-    with sd.RawInputStream(samplerate=sample_rate, blocksize=chunk * 10, device=device_name, dtype='int16',
+    import sounddevice as sd
+    with sd.RawInputStream(samplerate=sample_rate, blocksize=chunk * 10, device=input_device()['name'], dtype='int16',
                             channels=1, callback=callback):
         print('#' * 80)
         print('Press Ctrl+C to stop the recording')
@@ -138,9 +194,7 @@ def action_listen(cmd_handler, model, sample_rate, cmd_table, d, chunk):
             data = q.get()
             # Send the received audio data into recognizer
             if rec.AcceptWaveform(data):
-                res = rec.Result()
-                # The structure of res is fixed, so for convenience
-                text = res[14:-3]
+                text, _ = parse_result(rec.Result())
 
                 print(f'final text: {text}')
                 # Get the mapped command.
@@ -156,3 +210,459 @@ def action_listen(cmd_handler, model, sample_rate, cmd_table, d, chunk):
             #    # print(type(partial), partial==p)
             #    if not partial[16] == partial[17] == '"':
             #        logger.debug(f'partial: {partial}')
+
+
+class RecognitionSession:
+    """A long-lived recognition session that keeps one recognizer and one audio stream open.
+
+    ``action_listen`` builds a new ``KaldiRecognizer`` and opens a new ``RawInputStream`` for every command and
+    tears both down once a command is matched, so audio arriving in between is lost. A session is opened once and
+    yields every matched command from ``commands()``; the recognizer is ``Reset()`` between utterances.
+
+    Attributes
+    ----------
+    model : vosk.Model, concurrent.futures.Future
+        The vosk model for speech recognition, or the future of a model being loaded by ``load_model_async``.
+        In that case the audio stream is started first and the recognizer is created once the model is loaded.
+
+    sample_rate : int
+        The sample rate when receiving audio data.
+
+    cmd_table : dict{ str:str }
+        Key represents the result of speech recognition(voice command).
+        Value represents the corresponding command.
+
+    matcher : CommandMatcher
+        The matcher compiled from cmd_table.
+
+    d : str
+        A customized dictionary indicating the range of words to be recognized.
+
+    chunk : int
+        The chunk size of the audio stream data.
+
+    blocksize : int
+        Samples per block of the audio stream, ``chunk * 10`` by default.
+
+    accept_size : int
+        Samples passed to the recognizer per ``AcceptWaveform`` call, ``blocksize`` by default. Blocks are
+        gathered into one reusable buffer until it is full, saving per-call overhead at the cost of latency.
+
+    rec : vosk.KaldiRecognizer
+        The recognizer, created in ``open()``.
+
+    source : MicrophoneSource, WavSource
+        The audio source, a MicrophoneSource created in ``open()`` unless another one is given.
+
+    device : int, str
+        The input device of the MicrophoneSource, see ``common.audio.input_device``. Several sessions on
+        different devices can share one vosk.Model, each with its own recognizer and audio queue.
+
+    early_commands : set
+        Commands fired from the partial result, before the end of the utterance, once the partial
+        hypothesis stayed the same for ``stable_partials`` recognizer calls. Only commands that cannot grow
+        into another command (see ``CommandMatcher.unambiguous``) are kept. The final result confirms the
+        command, or retracts it: ``RETRACT_CMD`` is yielded, then the command of the final result.
+
+    stable_partials : int
+        The number of recognizer calls a partial hypothesis must stay the same before it is committed.
+
+    min_confidence : float
+        Commands of utterances with a word below this confidence are rejected, except ``stop`` and
+        ``RETRACT_CMD``: a false stop does no harm, a missed one leaves the chair moving. Word confidences are
+        only computed by the recognizer (``SetWords(True)``) when it is above 0.
+
+    last_decision : tuple
+        (text, command, confidence, accepted) of the last utterance, decided once at its final result.
+
+    accepted, rejected : int
+        The numbers of utterances whose command was accepted, or rejected for a low confidence.
+
+    gate : common.vad.EnergyVAD, utils.WakeWordGate
+        The first stage in front of the recognizer, which only passes the audio around speech or around the
+        wake-up word; None to decode all the audio. When it closes, the utterance is ended with
+        ``FinalResult``.
+
+    queue : AudioQueue
+        The bounded queue between the audio callback and the recognizer, holding at most ``queue_seconds``
+        of audio. Its ``stats()`` tell about overruns and lag.
+
+    cmd_table, matcher and d are replaced together by ``set_table``.
+    """
+
+    # Undoes a command fired early that the final result does not confirm.
+    RETRACT_CMD = 'stop'
+
+    def __init__(self, model, sample_rate, cmd_table, d, chunk, queue_seconds=1.0, queue_policy='drop_oldest',
+                 blocksize=None, accept_size=None, source=None, early_commands=(), stable_partials=3,
+                 min_confidence=0.0, gate=None, device=None):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.cmd_table = cmd_table
+        self.matcher = CommandMatcher(cmd_table)
+        self.d = d
+        self.chunk = chunk
+        self.blocksize = blocksize or chunk * 10
+        self.accept_size = accept_size or self.blocksize
+        self.rec = None
+        self.source = source
+        self.device = device
+        self._closed = False
+        self._early_requested = set(early_commands)
+        self.early_commands = self._unambiguous(self._early_requested)
+        self._pending_table = None
+        self.stable_partials = stable_partials
+        self._partial = ''
+        self._partial_count = 0
+        self._early = ''
+        self.min_confidence = min_confidence
+        self.last_decision = None
+        self.accepted = 0
+        self.rejected = 0
+        self.gate = gate
+        self._gate_open = False
+        blocks_per_sec = (sample_rate or 16000) / self.blocksize
+        self.queue = AudioQueue(maxsize=max(1, int(queue_seconds * blocks_per_sec)), policy=queue_policy)
+        # int16 samples, so 2 bytes each.
+        self._buf = bytearray(self.accept_size * 2)
+        # A cffi view of _buf, so that AcceptWaveform does not copy it; a bytes copy per call if vosk no
+        # longer exposes its ffi (see requirements.txt).
+        ffi = getattr(vosk, '_ffi', None)
+        self._buf_data = ffi.from_buffer(self._buf) if ffi is not None else None
+        self._buf_len = 0
+
+    def _unambiguous(self, commands):
+        early_commands = {c for c in commands if self.matcher.unambiguous(c)}
+        for c in commands - early_commands:
+            logger.warning(f'{c} is ambiguous while the utterance is not complete, not fired early')
+        return early_commands
+
+    def set_table(self, cmd_table, d):
+        """Replace the command table and the grammar, e.g. from a ``common.reload.TableWatcher``.
+
+        Can be called from any thread. The table is compiled here and swapped in by the recognizer thread at
+        the next utterance boundary, where only the grammar of the recognizer is replaced (``SetGrammar``);
+        the model is not reloaded.
+        """
+
+        self._pending_table = (cmd_table, CommandMatcher(cmd_table), d, time.perf_counter())
+
+    def _swap_table(self):
+        # Not in the middle of an utterance: the gate is closed, or nothing has been recognized yet.
+        if (self.gate is None or self._gate_open) and json.loads(self.rec.PartialResult())['partial']:
+            return
+        pending = self._pending_table
+        self.cmd_table, self.matcher, self.d, staged = pending
+        if self._pending_table is pending:
+            self._pending_table = None
+        s = time.perf_counter()
+        self.rec.SetGrammar(self.d)
+        self.early_commands = self._unambiguous(self._early_requested)
+        logger.info(f'grammar swapped in {(time.perf_counter() - s) * 1e3:.1f}ms, '
+                    f'{(time.perf_counter() - staged) * 1e3:.1f}ms after the table was set')
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _callback(self, in_data, frames, time_info, status):
+        """Same as ``callback`` but feeds the bounded queue of this session."""
+
+        s = time.perf_counter()
+        self.queue.put(in_data, status)
+        AUDIO_CALLBACK.observe(time.perf_counter() - s)
+
+    def open(self, callback=None):
+        """Start the audio stream and create the recognizer.
+
+        Parameters
+        ----------
+        callback : callable
+            Called for every audio block instead of queueing it in ``queue``, see ``AsyncRecognitionSession``.
+        """
+
+        if self.sample_rate is None:
+            device_info = input_device(self.device)
+            self.sample_rate = int(device_info['default_sample_rate'])
+
+        # Audio is queued while the model may still be loading.
+        self._closed = False
+        if self.source is None:
+            self.source = MicrophoneSource(sample_rate=self.sample_rate, blocksize=self.blocksize,
+                                           device=self.device)
+        self.source.start(callback=callback or self._callback)
+        self.model = load_model(self.model)
+        self.rec = vosk.KaldiRecognizer(self.model, self.sample_rate, self.d)
+        if self.min_confidence > 0:
+            self.rec.SetWords(True)
+
+    def close(self):
+        """Stop the audio source, ``commands()`` returns."""
+
+        self._closed = True
+        if self.source is not None:
+            self.source.stop()
+
+    def commands(self):
+        """Recognize voice commands from the audio stream.
+
+        Yields
+        ------
+        cmd : str
+            The mapped command of each recognized utterance, until the audio source is finished or the session
+            is closed.
+        """
+
+        overruns = self.queue.overruns
+        while True:
+            try:
+                data, captured = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                # A replayed source may run out of audio.
+                if self.source.finished or self._closed:
+                    return
+                continue
+            QUEUE_WAIT.observe(time.monotonic() - captured)
+            yield from self.decode(data)
+            self.queue.done(captured)
+            if self.queue.overruns != overruns:
+                overruns = self.queue.overruns
+                logger.warning(f'recognizer falls behind the audio: {self.queue.stats()}')
+
+    def decode(self, data):
+        """Feed audio data to the recognizer.
+
+        The data is gathered in the buffer and passed to the recognizer every ``accept_size`` samples. With a
+        ``gate``, only the audio it passes is.
+
+        Parameters
+        ----------
+        data : bytes
+            int16 audio data.
+
+        Yields
+        ------
+        cmd : str
+            The mapped command of each utterance recognized in the data.
+        """
+
+        if self._pending_table is not None and self.rec is not None:
+            self._swap_table()
+        if self.gate is not None:
+            s = time.perf_counter()
+            data = self.gate.filter(data)
+            GATE.observe(time.perf_counter() - s)
+            if not data:
+                if self._gate_open:
+                    # The gate closed, end the utterance now rather than with the next one.
+                    self._gate_open = False
+                    self._buf_len = 0
+                    yield from self._final(self.rec.FinalResult())
+                return
+            self._gate_open = True
+        view = memoryview(data)
+        while view:
+            n = min(len(self._buf) - self._buf_len, len(view))
+            self._buf[self._buf_len:self._buf_len + n] = view[:n]
+            self._buf_len += n
+            view = view[n:]
+            if self._buf_len < len(self._buf):
+                break
+            self._buf_len = 0
+
+            # Send the received audio data into recognizer
+            s = time.perf_counter()
+            final = self.rec.AcceptWaveform(self._buf_data if self._buf_data is not None else bytes(self._buf))
+            DECODE.observe(time.perf_counter() - s)
+            if final:
+                yield from self._final(self.rec.Result())
+            elif self.early_commands and not self._early:
+                cmd = self._check_partial()
+                if cmd:
+                    self._early = cmd
+                    logger.info(f'exec command (early): {cmd}')
+                    yield cmd
+
+    def _final(self, res):
+        """Yield the command of a final result, confirming or retracting an early command."""
+
+        cmd = self._decide(res)
+        early, self._early = self._early, ''
+        self._partial, self._partial_count = '', 0
+        if early:
+            if cmd == early:
+                logger.info(f'confirmed command: {cmd}')
+                self.rec.Reset()
+                return
+            logger.info(f'retracted command: {early}, final text: {self.last_decision[0]}')
+            if early != self.RETRACT_CMD:
+                yield self.RETRACT_CMD
+        if cmd:
+            logger.info(f'exec command: {cmd}')
+            yield cmd
+            # Start the next utterance from a clean state.
+            self.rec.Reset()
+
+    def _decide(self, res):
+        """Map the final result of an utterance to its command, or '' if there is none or it is rejected."""
+
+        text, confidence = parse_result(res)
+        logger.info(f'final text: {text}')
+        # Get the mapped command.
+        s = time.perf_counter()
+        cmd = text2cmd(text, self.matcher)
+        TEXT2CMD.observe(time.perf_counter() - s)
+        accepted = confidence >= self.min_confidence or cmd in ('stop', self.RETRACT_CMD)
+        if cmd:
+            if accepted:
+                self.accepted += 1
+                COMMANDS.inc()
+            else:
+                self.rejected += 1
+                REJECTED.inc()
+                logger.info(f'rejected command: {cmd}, confidence {confidence:.2f}')
+        self.last_decision = (text, cmd, confidence, accepted)
+        return cmd if accepted else ''
+
+    def _check_partial(self):
+        """Return the command of the partial result once it is stable, and fired early."""
+
+        partial = json.loads(self.rec.PartialResult())['partial']
+        if partial != self._partial:
+            self._partial, self._partial_count = partial, 1
+            return ''
+        self._partial_count += 1
+        if self._partial_count < self.stable_partials:
+            return ''
+        cmd = text2cmd(partial, self.matcher)
+        return cmd if cmd in self.early_commands else ''
+
+
+class AsyncRecognitionSession:
+    """asyncio front end of a RecognitionSession.
+
+    The audio callback hands every block to the event loop with ``call_soon_threadsafe``, into a queue of at
+    most ``maxsize`` blocks (the oldest are dropped beyond, as ``AudioQueue`` does). The blocks are decoded by
+    ``RecognitionSession.decode`` in a single thread executor, all the blocks queued meanwhile in one call,
+    so the loop never waits for the recognizer. The recognizer, the gate, the command table and the early
+    commands are those of the wrapped session.
+
+    Usage::
+
+        async with AsyncRecognitionSession(session) as s:
+            async for cmd in s.commands():
+                ...
+
+    Attributes
+    ----------
+    session : RecognitionSession
+        The wrapped session, not opened yet.
+
+    maxsize : int
+        The maximum number of blocks of audio queued, the maxsize of the queue of the session.
+
+    dropped : int
+        The number of blocks dropped because the queue was full.
+    """
+
+    def __init__(self, session, executor=None):
+        self.session = session
+        self.maxsize = session.queue.maxsize
+        self.dropped = 0
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='decode')
+        self._own_executor = executor is None
+        self._loop = None
+        self._blocks = None
+        self._closed = False
+        self._watcher = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def set_table(self, cmd_table, d):
+        """As ``RecognitionSession.set_table``, from any thread."""
+
+        self.session.set_table(cmd_table, d)
+
+    def _callback(self, in_data, frames, time_info, status):
+        s = time.perf_counter()
+        self._loop.call_soon_threadsafe(self._put, bytes(in_data), time.monotonic())
+        AUDIO_CALLBACK.observe(time.perf_counter() - s)
+
+    def _put(self, data, captured):
+        if self._blocks.qsize() >= self.maxsize:
+            self._blocks.get_nowait()
+            self.dropped += 1
+        self._blocks.put_nowait((data, captured))
+
+    async def open(self):
+        """Start the audio stream and create the recognizer, in the executor while the model loads."""
+
+        self._loop = asyncio.get_running_loop()
+        self._blocks = asyncio.Queue()
+        self._closed = False
+        await self._loop.run_in_executor(self._executor, self.session.open, self._callback)
+        self._watcher = self._loop.create_task(self._watch_source())
+
+    async def _watch_source(self):
+        # A replayed source may run out of audio, then end the stream after the last block.
+        while not self.session.source.finished:
+            await asyncio.sleep(0.5)
+        self._blocks.put_nowait(None)
+
+    def close(self):
+        """Stop the audio source, ``commands()`` returns. Call from the event loop."""
+
+        self._closed = True
+        self.session.close()
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._blocks is not None:
+            self._blocks.put_nowait(None)
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    def stats(self):
+        """The counters of the queue, as a dict."""
+
+        return {'depth': self._blocks.qsize() if self._blocks else 0, 'maxsize': self.maxsize,
+                'dropped': self.dropped}
+
+    def _decode(self, data):
+        return list(self.session.decode(data))
+
+    async def commands(self):
+        """Recognize voice commands from the audio stream.
+
+        Yields
+        ------
+        cmd : str
+            The mapped command of each recognized utterance, until the audio source is finished or the session
+            is closed.
+        """
+
+        while True:
+            item = await self._blocks.get()
+            if item is None:
+                # Closed, or the end of a replayed source; the next call returns at once too.
+                self._blocks.put_nowait(None)
+                return
+            data, captured = item
+            QUEUE_WAIT.observe(time.monotonic() - captured)
+            # Decode what arrived meanwhile in the same call, a recognizer that fell behind catches up.
+            blocks = [data]
+            while not self._blocks.empty():
+                item = self._blocks.get_nowait()
+                if item is None:
+                    self._blocks.put_nowait(None)
+                    break
+                blocks.append(item[0])
+            for cmd in await self._loop.run_in_executor(self._executor, self._decode, b''.join(blocks)):
+                yield cmd